@@ -0,0 +1,49 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app import models  # noqa: F401  (registers the tables on Base.metadata)
+from app.database import Base, engine
+
+config = context.config
+
+# app.migrations passes the connection to migrate; the alembic command line
+# connects through app.database.engine.
+connection = config.attributes.get("connection")
+
+if connection is None and config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """Emit the migration SQL (alembic upgrade --sql) instead of running it."""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite can only add constraints by recreating the table
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif connection is not None:
+    run_migrations(connection)
+else:
+    with engine.connect() as connection:
+        run_migrations(connection)
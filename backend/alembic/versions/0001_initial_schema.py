@@ -0,0 +1,89 @@
+"""Initial schema
+
+The tables as originally created by Base.metadata.create_all. Databases
+created that way are stamped with this revision by app.migrations.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("full_name", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("image_url", sa.String()),
+        sa.Column("category", sa.String()),
+        sa.Column("stock", sa.Integer()),
+        sa.Column("rating", sa.Float()),
+        sa.Column("review_count", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_products_id", "products", ["id"])
+    op.create_index("ix_products_name", "products", ["name"])
+    op.create_index("ix_products_category", "products", ["category"])
+
+    op.create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("quantity", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_cart_items_id", "cart_items", ["id"])
+
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("status", sa.String()),
+        sa.Column("shipping_address", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_orders_id", "orders", ["id"])
+
+    op.create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_order_items_id", "order_items", ["id"])
+
+
+def downgrade():
+    op.drop_table("order_items")
+    op.drop_table("orders")
+    op.drop_table("cart_items")
+    op.drop_table("products")
+    op.drop_table("users")
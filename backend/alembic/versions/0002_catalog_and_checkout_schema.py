@@ -0,0 +1,95 @@
+"""Catalog search, keyset pagination and checkout tables
+
+Adds the product full-text and keyset pagination indexes, makes product
+names unique (the catalog import upserts on them; remove duplicates first),
+enforces one cart row per product (merging existing duplicate rows), and
+creates the idempotency key and materialized order statistics tables.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Must match models.product_search_vector for the planner to use the index
+PRODUCT_SEARCH_VECTOR = (
+    "(setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(category, '')), 'B')) || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')"
+)
+
+
+def upgrade():
+    op.drop_index("ix_products_name", table_name="products")
+    op.create_index("ix_products_name", "products", ["name"], unique=True)
+    op.create_index("ix_products_price_id", "products", ["price", "id"])
+    op.create_index("ix_products_rating_id", "products", ["rating", "id"])
+    op.create_index("ix_products_created_at_id", "products", ["created_at", "id"])
+    if op.get_bind().dialect.name == "postgresql":
+        op.create_index(
+            "ix_products_search", "products", [sa.text(PRODUCT_SEARCH_VECTOR)], postgresql_using="gin"
+        )
+
+    # Concurrent add-to-cart requests could insert the same product twice;
+    # fold such rows into the oldest one before enforcing uniqueness
+    op.execute(
+        "UPDATE cart_items SET quantity = ("
+        " SELECT SUM(dup.quantity) FROM cart_items AS dup"
+        " WHERE dup.user_id = cart_items.user_id AND dup.product_id = cart_items.product_id"
+        ") WHERE id IN ("
+        " SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1"
+        ")"
+    )
+    op.execute(
+        "DELETE FROM cart_items WHERE EXISTS ("
+        " SELECT 1 FROM cart_items AS keep"
+        " WHERE keep.user_id = cart_items.user_id AND keep.product_id = cart_items.product_id"
+        " AND keep.id < cart_items.id"
+        ")"
+    )
+    with op.batch_alter_table("cart_items") as batch_op:
+        batch_op.create_unique_constraint("uq_cart_items_user_product", ["user_id", "product_id"])
+
+    op.create_index("ix_orders_user_created_at_id", "orders", ["user_id", "created_at", "id"])
+
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("key", sa.String(255), nullable=False),
+        sa.Column("request_hash", sa.String(64), nullable=False),
+        sa.Column("response_body", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+    op.create_index("ix_idempotency_keys_id", "idempotency_keys", ["id"])
+
+    op.create_table(
+        "user_order_stats",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("status", sa.String(), primary_key=True),
+        sa.Column("order_count", sa.Integer(), nullable=False),
+        sa.Column("total_spent", sa.Float(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("user_order_stats")
+    op.drop_table("idempotency_keys")
+    op.drop_index("ix_orders_user_created_at_id", table_name="orders")
+    with op.batch_alter_table("cart_items") as batch_op:
+        batch_op.drop_constraint("uq_cart_items_user_product", type_="unique")
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_products_search", table_name="products")
+    op.drop_index("ix_products_created_at_id", table_name="products")
+    op.drop_index("ix_products_rating_id", table_name="products")
+    op.drop_index("ix_products_price_id", table_name="products")
+    op.drop_index("ix_products_name", table_name="products")
+    op.create_index("ix_products_name", "products", ["name"])
@@ -0,0 +1,36 @@
+"""Foreign key and order listing indexes
+
+order_items had no index on either foreign key, so loading the items of an
+order and any lookup by product scanned the whole table; cart_items.product_id
+was unindexed too. cart_items.user_id and orders.user_id are already served
+by the leading column of uq_cart_items_user_product and
+ix_orders_user_created_at_id. Also indexes the order listings by status and
+by date range.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+    op.create_index("ix_order_items_product_id", "order_items", ["product_id"])
+    op.create_index("ix_cart_items_product_id", "cart_items", ["product_id"])
+    op.create_index("ix_orders_status_created_at", "orders", ["status", "created_at"])
+    op.create_index("ix_orders_created_at", "orders", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_orders_created_at", table_name="orders")
+    op.drop_index("ix_orders_status_created_at", table_name="orders")
+    op.drop_index("ix_cart_items_product_id", table_name="cart_items")
+    op.drop_index("ix_order_items_product_id", table_name="order_items")
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app.database import get_db, db_endpoint
+from app.cache import TTLCache
+from app.passwords import pwd_context
 from app import models, schemas
 import os
 from dotenv import load_dotenv
@@ -15,8 +16,17 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Short-lived cache of users loaded by get_current_user; 0 disables it.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+# Comma-separated usernames allowed to call admin endpoints (bulk exports and
+# imports of other users' or catalog data); empty means nobody.
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# User columns kept in the cache, enough to rebuild a detached models.User.
+_USER_CACHE_COLUMNS = ("id", "email", "username", "hashed_password", "full_name", "is_active", "created_at")
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def verify_password(plain_password, hashed_password):
@@ -35,6 +45,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None):
+    """Issue a token carrying the claims get_token_user needs, so it can skip the DB."""
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "email": user.email},
+        expires_delta=expires_delta,
+    )
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
@@ -49,21 +66,93 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> schemas.TokenData:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = get_user_by_username(db, username=username)
-    if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    username: str = payload.get("sub")
+    if username is None:
+        raise _credentials_exception()
+    return schemas.TokenData(username=username, id=payload.get("uid"), email=payload.get("email"))
+
+async def get_token_user(token: str = Depends(oauth2_scheme)) -> schemas.TokenData:
+    """
+    Verify the token in-process and return its claims without touching the
+    database. For handlers that only need the user's id; tokens issued before
+    the id claim was added are rejected and the client has to log in again.
+    """
+    token_data = _decode_token(token)
+    if token_data.id is None:
+        raise _credentials_exception()
+    return token_data
+
+def cache_user(user: models.User):
+    user_cache.set(user.id, {column: getattr(user, column) for column in _USER_CACHE_COLUMNS})
+
+def invalidate_user(user_id: int):
+    """Drop a cached user, e.g. after deactivating it or changing its credentials."""
+    user_cache.delete(user_id)
+
+def _get_cached_user(db: Session, user_id: int) -> Optional[models.User]:
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        return None
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+@db_endpoint
+def get_active_token_user(
+    token_data: schemas.TokenData = Depends(get_token_user),
+    db: Session = Depends(get_db),
+) -> schemas.TokenData:
+    """
+    get_token_user for write paths: also check that the user still exists and
+    is active, from user_cache when possible, so that an unexpired token of a
+    deactivated or deleted account cannot keep writing carts and orders.
+    """
+    snapshot = user_cache.get(token_data.id)
+    if snapshot is not None:
+        if not snapshot["is_active"]:
+            raise _credentials_exception()
+        return token_data
+    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    if user is None or not user.is_active:
+        raise _credentials_exception()
+    # Only active users are cached; get_current_user trusts cache hits
+    cache_user(user)
+    return token_data
+
+@db_endpoint
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    token_data = _decode_token(token)
+    if token_data.id is not None:
+        user = _get_cached_user(db, token_data.id)
+        if user is not None:
+            if not user.is_active:
+                raise _credentials_exception()
+            return user
+        user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    else:
+        user = get_user_by_username(db, username=token_data.username)
+    if user is None or not user.is_active:
+        raise _credentials_exception()
+    cache_user(user)
     return user
 
+async def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """The current user, who must be listed in ADMIN_USERNAMES"""
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
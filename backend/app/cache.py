@@ -0,0 +1,220 @@
+"""
+In-process caches.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.serialization import dump_json
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like ``get``, but leaves the hit/miss counters and LRU order alone."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.monotonic():
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# ---------------------------------------------------------
+# Catalog response cache
+# ---------------------------------------------------------
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "60"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+
+_VERSION_KEY = "__version__"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: str
+    headers: Dict[str, str]
+
+
+class ResponseCache:
+    """
+    Cache of serialized JSON responses keyed on path and query string.
+
+    ``backend`` is anything with ``get(key)`` and ``set(key, value, ttl=None)``
+    (and optionally ``peek(key)``, a lookup that is not counted in the stats);
+    the default is an in-process TTLCache, and a shared store can be plugged in
+    with ``set_backend``. Entries are keyed on a generation token kept in the
+    backend itself, so ``invalidate`` replaces the token instead of deleting
+    entries, which also works for backends shared between workers. A fresh
+    token is drawn whenever it is missing (e.g. evicted), so old entries can
+    never be served again.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    def _new_generation(self) -> Tuple[int, float]:
+        generation = (time.time_ns(), time.time())
+        self.backend.set(_VERSION_KEY, generation, ttl=float("inf"))
+        return generation
+
+    def _generation(self) -> Tuple[int, float]:
+        # Read on every request; through get() it would count as a hit each
+        # time and push the hit ratio towards 1
+        peek = getattr(self.backend, "peek", self.backend.get)
+        return peek(_VERSION_KEY) or self._new_generation()
+
+    def invalidate(self):
+        self._new_generation()
+
+    def respond(
+        self,
+        request: Request,
+        schema,
+        build: Callable[[], Tuple[Any, Dict[str, str]]],
+        ttl: Optional[float] = None,
+    ) -> Response:
+        """
+        Serve ``request`` from the cache, calling ``build`` on a miss. ``build``
+        returns the response data (validated against ``schema``) and extra
+        response headers to cache along with it. ``ttl`` shortens the lifetime
+        of the cached response, e.g. when it is built from data cached elsewhere.
+        """
+        if self.ttl <= 0:
+            data, headers = build()
+            return Response(content=dump_json(schema, data), media_type="application/json", headers=headers)
+
+        version, modified_at = self._generation()
+        key = (version, request.url.path, tuple(sorted(request.query_params.multi_items())))
+        cached = self.backend.get(key)
+        if cached is None:
+            data, headers = build()
+            body = dump_json(schema, data)
+            cached = CachedResponse(
+                body=body,
+                etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+                last_modified=formatdate(modified_at, usegmt=True),
+                headers=headers,
+            )
+            self.backend.set(key, cached, ttl=self.ttl if ttl is None else min(ttl, self.ttl))
+
+        headers = {
+            "ETag": cached.etag,
+            "Last-Modified": cached.last_modified,
+            "Cache-Control": "no-cache",
+            **cached.headers,
+        }
+        if _not_modified(request, cached, modified_at):
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def _not_modified(request: Request, cached: CachedResponse, modified_at: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or cached.etag in tags or f"W/{cached.etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modified_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+catalog_cache = ResponseCache(
+    TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL_SECONDS),
+    ttl=CATALOG_CACHE_TTL_SECONDS,
+)
+
+_catalog_listeners: List[Callable[[], None]] = []
+
+
+def on_catalog_change(listener: Callable[[], None]):
+    """Register ``listener`` to run whenever products are created or updated."""
+    _catalog_listeners.append(listener)
+    return listener
+
+
+def invalidate_catalog(stock_only: bool = False):
+    """
+    Call after creating or updating products, or with ``stock_only`` after
+    changing only stock levels (checkout, cancellation). Cached responses are
+    always dropped; on_catalog_change listeners, which cache data that stock
+    does not affect or that may lag behind it, only run for product changes.
+    """
+    catalog_cache.invalidate()
+    if stock_only:
+        return
+    for listener in _catalog_listeners:
+        listener()
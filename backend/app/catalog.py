@@ -0,0 +1,33 @@
+"""
+Read-only product queries.
+
+Catalog listings are only ever serialized, so they select the
+schemas.ProductResponse columns into plain rows instead of loading
+models.Product instances: no identity map entries, attribute instrumentation
+or relationship state is set up per product. Rows expose the columns as
+attributes, so they validate against ProductResponse (from_attributes) just
+like ORM objects.
+"""
+from typing import List, Sequence
+
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session
+
+from app import models, schemas
+
+# Column order of the rows, id first
+PRODUCT_FIELDS = ("id",) + tuple(field for field in schemas.ProductResponse.model_fields if field != "id")
+PRODUCT_COLUMNS = tuple(getattr(models.Product, field) for field in PRODUCT_FIELDS)
+
+
+def query_products(db: Session) -> Query:
+    """Query of product rows holding the ProductResponse columns."""
+    return db.query(*PRODUCT_COLUMNS)
+
+
+def products_by_ids(db: Session, ids: Sequence[int]) -> List[Row]:
+    """Product rows for ``ids``, in the order given; unknown ids are left out."""
+    if not ids:
+        return []
+    rows = {row.id: row for row in query_products(db).filter(models.Product.id.in_(ids))}
+    return [rows[product_id] for product_id in ids if product_id in rows]
@@ -0,0 +1,224 @@
+"""
+Bulk catalog import.
+
+Supplier feeds (CSV with a header row, or JSON Lines) are read as a stream,
+validated row by row against schemas.ProductCreate and loaded in batches
+keyed on the unique product name: new names are inserted, existing ones are
+updated (or left alone with ``update_existing=False``). Each batch is
+committed on its own, so a failure part-way keeps the batches loaded so far.
+
+On PostgreSQL (psycopg2) a batch is sent with COPY into a temporary staging
+table and merged with a single INSERT ... SELECT ... ON CONFLICT; other
+dialects use multi-row INSERT ... ON CONFLICT statements.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.database import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Invalid rows are all counted, but only the first ones are reported back.
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = ("csv", "jsonl")
+IMPORT_FORMAT_PATTERN = "^(" + "|".join(IMPORT_FORMATS) + ")$"
+
+products = models.Product.__table__
+
+
+# ---------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------
+
+def _parse_csv(stream: Iterable[str]) -> Iterator[Tuple[int, object]]:
+    reader = csv.DictReader(stream)
+    for record in reader:
+        # Empty cells fall back to the schema defaults
+        yield reader.line_num, {key: value for key, value in record.items() if key and value not in ("", None)}
+
+
+def _parse_jsonl(stream: Iterable[str]) -> Iterator[Tuple[int, object]]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+def parse_records(stream: Iterable[str], import_format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, record dict or parse error) for each input record.
+
+    ``stream`` is a text file or any iterable of lines.
+    """
+    if import_format == "csv":
+        return _parse_csv(stream)
+    if import_format == "jsonl":
+        return _parse_jsonl(stream)
+    raise ValueError(f"Unsupported import format: {import_format}")
+
+
+def detect_format(filename: Optional[str]) -> Optional[str]:
+    if filename:
+        extension = filename.rsplit(".", 1)[-1].lower()
+        if extension in ("jsonl", "ndjson"):
+            return "jsonl"
+        if extension == "csv":
+            return "csv"
+    return None
+
+
+# ---------------------------------------------------------
+# Loading
+# ---------------------------------------------------------
+
+def _load_copy(db: Session, rows: Sequence[Dict], columns: Sequence[str], update_existing: bool) -> int:
+    """Load ``rows`` with COPY into a staging table and merge them into products."""
+    column_list = ", ".join(columns)
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS product_import "
+        "(name text, description text, price double precision, image_url text, "
+        "category text, stock integer, rating double precision, review_count integer) "
+        "ON COMMIT DELETE ROWS"
+    ))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([r"\N" if row.get(column) is None else row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY product_import ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+    finally:
+        cursor.close()
+
+    insert_columns = list(columns)
+    select_columns = list(columns)
+    for column, default in (("rating", "0.0"), ("review_count", "0")):
+        if column not in columns:
+            insert_columns.append(column)
+            select_columns.append(default)
+    if update_existing:
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "name")
+        conflict = f"ON CONFLICT (name) DO UPDATE SET {updates}"
+    else:
+        conflict = "ON CONFLICT (name) DO NOTHING"
+    result = db.execute(text(
+        f"INSERT INTO products ({', '.join(insert_columns)}) "
+        f"SELECT {', '.join(select_columns)} FROM product_import {conflict}"
+    ))
+    return result.rowcount
+
+
+def _load_upsert(db: Session, rows: Sequence[Dict], columns: Sequence[str], update_existing: bool) -> int:
+    """Load ``rows`` with multi-row INSERT ... ON CONFLICT statements."""
+    stmt = upsert_insert(db, products)
+    if update_existing:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[products.c.name],
+            set_={column: stmt.excluded[column] for column in columns if column != "name"},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[products.c.name])
+    # Executed as batches of multi-row VALUES; RETURNING tells how many rows
+    # were inserted or updated.
+    return len(db.execute(stmt.returning(products.c.id), list(rows)).all())
+
+
+def load_batch(db: Session, rows: Sequence[Dict], update_existing: bool = True) -> int:
+    """
+    Insert or update ``rows`` (dicts with the same keys, including "name") in
+    the current transaction and return how many products were written. Later
+    rows win over earlier rows with the same name.
+    """
+    deduplicated = list({row["name"]: row for row in rows}.values())
+    if not deduplicated:
+        return 0
+    columns = list(deduplicated[0])
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2":
+        return _load_copy(db, deduplicated, columns, update_existing)
+    return _load_upsert(db, deduplicated, columns, update_existing)
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    return str(error)
+
+
+def import_products(
+    db: Session,
+    records: Iterable[Tuple[int, object]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    update_existing: bool = True,
+    on_progress: Optional[Callable[[schemas.ProductImportResult], None]] = None,
+) -> schemas.ProductImportResult:
+    """
+    Validate and load ``records`` (as produced by ``parse_records``), committing
+    every ``batch_size`` valid rows. ``on_progress`` is called after each batch.
+    """
+    stats = schemas.ProductImportResult()
+    start = time.perf_counter()
+    batch: List[Dict] = []
+
+    def flush():
+        stats.loaded += load_batch(db, batch, update_existing=update_existing)
+        db.commit()
+        stats.batches += 1
+        stats.elapsed_seconds = round(time.perf_counter() - start, 3)
+        batch.clear()
+        if on_progress:
+            on_progress(stats)
+
+    try:
+        for line_number, record in records:
+            stats.processed += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                if not isinstance(record, dict):
+                    raise ValueError("Expected an object")
+                batch.append(schemas.ProductCreate.model_validate(record).model_dump())
+            except (ValidationError, ValueError) as e:
+                stats.failed += 1
+                if len(stats.errors) < MAX_REPORTED_ERRORS:
+                    stats.errors.append(schemas.ProductImportError(line=line_number, error=_describe(e)))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        stats.elapsed_seconds = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def log_progress(stats: schemas.ProductImportResult):
+    rate = stats.processed / stats.elapsed_seconds if stats.elapsed_seconds else 0.0
+    logger.info(
+        f"Catalog import: {stats.processed} rows processed, {stats.loaded} loaded, "
+        f"{stats.failed} failed ({rate:.0f} rows/s)"
+    )
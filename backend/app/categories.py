@@ -0,0 +1,102 @@
+"""
+In-memory category summary.
+
+Category names and per-category facets (product count, price range, in-stock
+count) are computed with a single GROUP BY and then served from memory for up
+to CATALOG_CACHE_TTL_SECONDS, like the catalog responses. Product writes made
+through this process drop the summary right away. Stock changes (checkout,
+cancellation) and writes made by other workers or scripts show up once it
+expires.
+"""
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.cache import CATALOG_CACHE_TTL_SECONDS, on_catalog_change
+from app.database import DB_ASYNC
+
+# (monotonic time it was loaded, summary)
+_cached: Optional[Tuple[float, List[schemas.CategorySummary]]] = None
+_version = 0
+_lock = threading.Lock()
+
+
+@on_catalog_change
+def invalidate():
+    global _cached, _version
+    _version += 1
+    _cached = None
+
+
+def _fresh() -> Optional[List[schemas.CategorySummary]]:
+    cached = _cached
+    if cached is not None and time.monotonic() - cached[0] < CATALOG_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+def expires_in() -> float:
+    """
+    Seconds until the summary is reloaded (a full TTL if the next read loads
+    it); responses built from it should not be cached for longer.
+    """
+    cached = _cached
+    if cached is None:
+        return CATALOG_CACHE_TTL_SECONDS
+    remaining = cached[0] + CATALOG_CACHE_TTL_SECONDS - time.monotonic()
+    return remaining if remaining > 0 else CATALOG_CACHE_TTL_SECONDS
+
+
+def _load(db: Session) -> List[schemas.CategorySummary]:
+    Product = models.Product
+    rows = db.query(
+        Product.category,
+        func.count(Product.id),
+        func.min(Product.price),
+        func.max(Product.price),
+        func.sum(case((Product.stock > 0, 1), else_=0)),
+    ).filter(Product.category.isnot(None)).group_by(Product.category).order_by(Product.category).all()
+    return [
+        schemas.CategorySummary(
+            category=category,
+            product_count=count,
+            min_price=min_price,
+            max_price=max_price,
+            in_stock_count=in_stock or 0,
+        )
+        for category, count, min_price, max_price, in_stock in rows
+        if category
+    ]
+
+
+def get_summaries(db: Session) -> List[schemas.CategorySummary]:
+    global _cached
+    summaries = _fresh()
+    if summaries is not None:
+        return summaries
+    # With DB_ASYNC the loads run in greenlets on the event loop thread, where
+    # waiting for the lock would block the loop; concurrent loads then each
+    # query the database instead.
+    if not _lock.acquire(blocking=not DB_ASYNC):
+        return _load(db)
+    try:
+        summaries = _fresh()
+        if summaries is not None:
+            return summaries
+        version = _version
+        loaded_at = time.monotonic()
+        summaries = _load(db)
+        # Only publish if no write invalidated the summary while it was loading.
+        if version == _version:
+            _cached = (loaded_at, summaries)
+        return summaries
+    finally:
+        _lock.release()
+
+
+def get_category_names(db: Session) -> List[str]:
+    return [summary.category for summary in get_summaries(db)]
@@ -1,10 +1,19 @@
 import os
+import asyncio
+import inspect
 import logging
+import functools
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, PoolValidator, pool_status
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -20,34 +29,131 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 
+# Complete SQLAlchemy URL, used instead of the DB_* settings when set. A
+# sqlite:///path/to/file.db URL runs the API on an embedded SQLite database
+# (local development, benchmarks); it must point to a file, not :memory:.
+DATABASE_URL_SETTING = os.getenv("DATABASE_URL")
+
+# Serve routers from an asyncpg-backed AsyncSession instead of the threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# ---------------------------------------------------------
+# CONNECTION POOL SETTINGS
+# ---------------------------------------------------------
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))      # seconds to wait for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 150))       # seconds before a connection is replaced
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))  # 0 keeps the server default
+
+# How pooled connections are checked for liveness:
+#   checkout   - ping on every checkout (pool_pre_ping)
+#   background - ping idle connections every DB_POOL_VALIDATE_INTERVAL seconds
+#   none       - rely on pool_recycle only
+DB_POOL_PING = os.getenv("DB_POOL_PING", "checkout").lower()
+DB_POOL_VALIDATE_INTERVAL = float(os.getenv("DB_POOL_VALIDATE_INTERVAL", 30))
+
+# Seconds the readiness check waits for a pooled connection to answer
+DB_HEALTH_TIMEOUT = float(os.getenv("DB_HEALTH_TIMEOUT", 2))
+
 # ---------------------------------------------------------
 # SQLAlchemy Database URL
 # ---------------------------------------------------------
 
-def get_database_url():
+# Drivers of the async engine, by backend
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def get_database_url(async_driver=False):
+    if DATABASE_URL_SETTING:
+        url = make_url(DATABASE_URL_SETTING)
+        if async_driver:
+            url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+        return url
+
     encoded_user = quote_plus(DB_USER)
     encoded_password = quote_plus(DB_PASSWORD)
+    driver = ASYNC_DRIVERS["postgresql"] if async_driver else "postgresql"
 
     return (
-        f"postgresql://{encoded_user}:{encoded_password}"
+        f"{driver}://{encoded_user}:{encoded_password}"
         f"@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     )
 
 
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers run while a request writes; writers wait for the lock
+    # instead of failing straight away with "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def get_pool_options():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
 # ---------------------------------------------------------
 # SQLAlchemy Engine + Session
 # ---------------------------------------------------------
 
 try:
     DATABASE_URL = get_database_url()
+    IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+    connect_args = {}
+    if IS_SQLITE:
+        # Pooled connections are handed between threadpool workers
+        connect_args["check_same_thread"] = False
+    elif DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
     engine = create_engine(
         DATABASE_URL,
-        pool_pre_ping=True,
-        pool_recycle=150
+        poolclass=InstrumentedQueuePool,
+        pool_pre_ping=DB_POOL_PING == "checkout",
+        connect_args=connect_args,
+        **get_pool_options()
     )
 
+    if IS_SQLITE:
+        event.listen(engine, "connect", _configure_sqlite)
+
     SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-    logger.info("Database engine created successfully (direct connection).")
+    logger.info(
+        "Database engine created successfully "
+        + ("(embedded SQLite)." if IS_SQLITE else "(direct connection).")
+    )
+
+    async_engine = None
+    AsyncSessionLocal = None
+    if DB_ASYNC:
+        async_connect_args = {}
+        if DB_STATEMENT_TIMEOUT_MS and not IS_SQLITE:
+            async_connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        # The background validator only runs on the sync pool: asyncpg
+        # connections can only be used from the event loop.
+        async_engine = create_async_engine(
+            get_database_url(async_driver=True),
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_pre_ping=DB_POOL_PING != "none",
+            connect_args=async_connect_args,
+            **get_pool_options()
+        )
+        # Objects stay loaded after commit: responses are serialized outside
+        # the greenlet, where an expired attribute could not be reloaded.
+        if IS_SQLITE:
+            event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+        AsyncSessionLocal = async_sessionmaker(
+            bind=async_engine, autoflush=False, expire_on_commit=False
+        )
+        logger.info(f"Async database engine created successfully ({async_engine.dialect.driver}).")
 
 except Exception as e:
     logger.error(f"Database connection failed: {e}")
@@ -63,3 +169,120 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def upsert_insert(db, table):
+    """``insert(table)`` with ON CONFLICT support for the session's dialect."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert(table)
+
+
+# Session dependency for async handlers that reach the DB through run_db:
+# an AsyncSession with DB_ASYNC enabled, a sync Session otherwise.
+get_session = get_async_db if DB_ASYNC else get_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run a sync ``fn(session, *args)`` from an async handler on either engine."""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def db_endpoint(func):
+    """
+    Serve a sync handler (or dependency) taking ``db: Session`` from the
+    configured engine.
+
+    With DB_ASYNC disabled the function is returned unchanged and FastAPI runs
+    it in its threadpool. With DB_ASYNC enabled it becomes a coroutine that
+    receives an AsyncSession and runs the original body through
+    ``AsyncSession.run_sync``, so queries await on asyncpg instead of holding
+    a worker thread. Handlers must return fully loaded objects: lazy loads
+    after the body returns are not possible on the async engine.
+    """
+    if not DB_ASYNC:
+        return func
+
+    signature = inspect.signature(func)
+    parameters = [
+        param.replace(default=Depends(get_async_db), annotation=AsyncSession)
+        if param.name == "db" else param
+        for param in signature.parameters.values()
+    ]
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        db = kwargs.pop("db")
+        return await db.run_sync(lambda session: func(*args, db=session, **kwargs))
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
+
+
+# ---------------------------------------------------------
+# Pool lifecycle + statistics
+# ---------------------------------------------------------
+
+pool_validator = PoolValidator(lambda: engine.pool, DB_POOL_VALIDATE_INTERVAL)
+
+
+def start_pool_validation():
+    if DB_POOL_PING == "background":
+        pool_validator.start()
+        logger.info(f"Validating idle DB connections every {DB_POOL_VALIDATE_INTERVAL}s.")
+
+
+def get_pool_stats():
+    stats = {"sync": pool_status(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = pool_status(async_engine.sync_engine.pool)
+    return stats
+
+
+def _ping_sync():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def _ping_async():
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def check_database(timeout: float = DB_HEALTH_TIMEOUT):
+    """
+    Run ``SELECT 1`` on a connection from each pool the routers use. Returns
+    None when the database answered within ``timeout`` seconds, otherwise a
+    description of the failure.
+    """
+    checks = [run_in_threadpool(_ping_sync)]
+    if async_engine is not None:
+        checks.append(_ping_async())
+    try:
+        await asyncio.wait_for(asyncio.gather(*checks), timeout)
+    except asyncio.TimeoutError:
+        return f"no database response within {timeout}s"
+    except Exception as e:
+        error = str(e).splitlines()[0] if str(e) else type(e).__name__
+        logger.warning(f"Database readiness check failed: {error}")
+        return error
+    return None
+
+
+async def close_engines():
+    pool_validator.stop()
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -0,0 +1,97 @@
+"""
+Idempotency keys for order submission.
+
+A client sends an ``Idempotency-Key`` header with ``POST /api/orders/`` and
+reuses it when retrying. The key is claimed in the same transaction that
+places the order and the serialized response is stored alongside it, so a
+retry gets the original response back without running checkout again. A
+concurrent retry blocks on the unique (user_id, key) index until the first
+attempt commits or rolls back. Keys expire after IDEMPOTENCY_KEY_TTL_HOURS.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+idempotency_keys = models.IdempotencyKey.__table__
+
+
+def fingerprint(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+def _cutoff() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def _replay(db: Session, user_id: int, key: str, request_hash: str) -> Optional[Response]:
+    row = db.execute(
+        select(idempotency_keys.c.request_hash, idempotency_keys.c.response_body).where(
+            idempotency_keys.c.user_id == user_id,
+            idempotency_keys.c.key == key,
+            idempotency_keys.c.created_at >= _cutoff(),
+        )
+    ).first()
+    if row is None or row.response_body is None:
+        return None
+    if row.request_hash != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{IDEMPOTENCY_KEY_HEADER} was already used for a different request",
+        )
+    return Response(
+        content=row.response_body,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def claim(db: Session, user_id: int, key: str, request_hash: str) -> Optional[Response]:
+    """
+    Return the stored response for ``key`` if there is one; otherwise claim the
+    key in the current transaction and return None. Call ``complete`` before
+    committing.
+    """
+    replay = _replay(db, user_id, key, request_hash)
+    if replay is not None:
+        return replay
+
+    # Drop this user's expired keys so an old key can be claimed again
+    db.execute(
+        delete(idempotency_keys).where(
+            idempotency_keys.c.user_id == user_id,
+            idempotency_keys.c.created_at < _cutoff(),
+        )
+    )
+    try:
+        db.execute(insert(idempotency_keys).values(user_id=user_id, key=key, request_hash=request_hash))
+    except IntegrityError:
+        # Another request with this key committed first
+        db.rollback()
+        replay = _replay(db, user_id, key, request_hash)
+        if replay is not None:
+            return replay
+        raise HTTPException(
+            status_code=409,
+            detail=f"A request with this {IDEMPOTENCY_KEY_HEADER} is already being processed",
+        )
+    return None
+
+
+def complete(db: Session, user_id: int, key: str, response: BaseModel):
+    db.execute(
+        update(idempotency_keys)
+        .where(idempotency_keys.c.user_id == user_id, idempotency_keys.c.key == key)
+        .values(response_body=response.model_dump_json())
+    )
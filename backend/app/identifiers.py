@@ -0,0 +1,112 @@
+"""
+Resolve the user identifiers accepted by the chatbot API (a user id, an email
+or a username) to a user id.
+
+All candidate columns are matched in a single query, and results, including
+identifiers that match no user, are kept in a small TTL cache. Not-found
+entries expire sooner and are dropped when a matching user registers.
+"""
+import os
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import TTLCache
+from app.database import get_db, db_endpoint
+
+IDENTIFIER_CACHE_TTL_SECONDS = float(os.getenv("IDENTIFIER_CACHE_TTL_SECONDS", "300"))
+IDENTIFIER_CACHE_MISS_TTL_SECONDS = float(os.getenv("IDENTIFIER_CACHE_MISS_TTL_SECONDS", "30"))
+IDENTIFIER_CACHE_SIZE = int(os.getenv("IDENTIFIER_CACHE_SIZE", "4096"))
+
+IDENTIFIER_TYPES = ("auto", "id", "email", "username")
+
+identifier_cache = TTLCache(maxsize=IDENTIFIER_CACHE_SIZE, ttl=IDENTIFIER_CACHE_TTL_SECONDS)
+
+_NOT_CACHED = object()
+
+
+def _lookup(db: Session, identifier: str, identifier_type: str) -> Optional[int]:
+    User = models.User
+    conditions = []
+    if identifier_type in ("auto", "id"):
+        if identifier.isdigit():
+            conditions.append(User.id == int(identifier))
+        elif identifier_type == "id":
+            raise HTTPException(status_code=400, detail="User id must be an integer")
+    if identifier_type in ("auto", "email"):
+        conditions.append(User.email == identifier)
+    if identifier_type in ("auto", "username"):
+        conditions.append(User.username == identifier)
+
+    rows = db.execute(select(User.id, User.email, User.username).where(or_(*conditions))).all()
+    if not rows:
+        return None
+
+    # An identifier can match different users in different columns; prefer
+    # the id, then the email, then the username.
+    def precedence(row):
+        if identifier.isdigit() and row.id == int(identifier) and identifier_type in ("auto", "id"):
+            return 0
+        if row.email == identifier:
+            return 1
+        return 2
+
+    return min(rows, key=precedence).id
+
+
+def resolve_user_id(db: Session, identifier: str, identifier_type: str = "auto") -> Optional[int]:
+    """Return the id of the user matching ``identifier``, or None."""
+    if identifier_type not in IDENTIFIER_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid identifier_type. Use 'id', 'email', 'username', or 'auto'")
+
+    key = (identifier_type, identifier)
+    user_id = identifier_cache.get(key, _NOT_CACHED)
+    if user_id is _NOT_CACHED:
+        user_id = _lookup(db, identifier, identifier_type)
+        identifier_cache.set(key, user_id, ttl=None if user_id is not None else IDENTIFIER_CACHE_MISS_TTL_SECONDS)
+    return user_id
+
+
+def forget_user(user: models.User):
+    """Drop cached lookups that could resolve to ``user``, e.g. after it registers."""
+    for identifier_type, value in (
+        ("id", str(user.id)),
+        ("email", user.email),
+        ("username", user.username),
+    ):
+        identifier_cache.delete((identifier_type, value))
+        identifier_cache.delete(("auto", value))
+
+
+# ---------------------------------------------------------
+# FastAPI dependencies
+# ---------------------------------------------------------
+
+@db_endpoint
+def user_id_from_identifier(
+    identifier: str,
+    identifier_type: str = Query("auto", description="Type: 'id', 'email', 'username', or 'auto'"),
+    db: Session = Depends(get_db)
+) -> int:
+    """Resolve the ``identifier`` path parameter, answering 404 if no user matches."""
+    user_id = resolve_user_id(db, identifier, identifier_type)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+
+@db_endpoint
+def optional_user_id(
+    user_identifier: Optional[str] = Query(None, description="Optional: user id, email, or username"),
+    db: Session = Depends(get_db)
+) -> Optional[int]:
+    """Resolve the optional ``user_identifier`` query parameter."""
+    if not user_identifier:
+        return None
+    user_id = resolve_user_id(db, user_identifier)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
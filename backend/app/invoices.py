@@ -0,0 +1,144 @@
+"""
+Invoice layout, shared by the single-invoice endpoint and the streaming
+batch export.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from sqlalchemy import select
+
+from app import models
+from app.streaming import stream_batches
+
+INVOICE_CSV_FIELDS = (
+    "invoice_number", "order_id", "invoice_date", "status",
+    "customer_user_id", "customer_name", "customer_email", "shipping_address",
+    "product_id", "product_name", "quantity", "unit_price", "subtotal",
+    "order_total", "currency",
+)
+
+
+class InvoiceLine(NamedTuple):
+    product_id: int
+    product_name: str
+    quantity: int
+    price: float
+
+
+def build_invoice(order, customer, items: Iterable[InvoiceLine]) -> Dict[str, Any]:
+    """Invoice data for ``order``; ``customer`` is its User (or a row with the same columns)."""
+    invoice_items = []
+    for item in items:
+        invoice_items.append({
+            "product_id": item.product_id,
+            "product_name": item.product_name,
+            "quantity": item.quantity,
+            "unit_price": item.price,
+            "subtotal": item.price * item.quantity
+        })
+    
+    return {
+        "invoice_number": f"INV-{order.id:06d}",
+        "order_id": order.id,
+        "invoice_date": order.created_at.isoformat(),
+        "order_date": order.created_at.isoformat(),
+        "status": order.status,
+        "customer": {
+            "user_id": customer.id,
+            "name": customer.full_name or customer.username,
+            "email": customer.email,
+            "username": customer.username
+        },
+        "shipping_address": order.shipping_address,
+        "items": invoice_items,
+        "subtotal": order.total_amount,
+        "tax": 0.0,  # Can be calculated if tax is implemented
+        "shipping": 0.0,  # Can be calculated if shipping fees are implemented
+        "total": order.total_amount,
+        "currency": "USD"  # Can be made configurable
+    }
+
+
+def invoice_csv_rows(invoices: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Flatten invoices to one CSV row per line item."""
+    for invoice in invoices:
+        header = {
+            "invoice_number": invoice["invoice_number"],
+            "order_id": invoice["order_id"],
+            "invoice_date": invoice["invoice_date"],
+            "status": invoice["status"],
+            "customer_user_id": invoice["customer"]["user_id"],
+            "customer_name": invoice["customer"]["name"],
+            "customer_email": invoice["customer"]["email"],
+            "shipping_address": invoice["shipping_address"],
+            "order_total": invoice["total"],
+            "currency": invoice["currency"],
+        }
+        for item in invoice["items"] or [{}]:
+            yield {**header, **item}
+
+
+# ---------------------------------------------------------
+# Batch export
+# ---------------------------------------------------------
+
+class _Customer(NamedTuple):
+    id: int
+    full_name: Optional[str]
+    username: str
+    email: str
+
+
+Order = models.Order.__table__
+User = models.User.__table__
+OrderItem = models.OrderItem.__table__
+Product = models.Product.__table__
+
+
+def _invoice_batch(db, rows):
+    """Build the invoices of one batch of order rows, loading their lines in one query."""
+    order_ids = [row.id for row in rows]
+    lines = defaultdict(list)
+    for line in db.execute(
+        select(
+            OrderItem.c.order_id,
+            OrderItem.c.product_id,
+            Product.c.name.label("product_name"),
+            OrderItem.c.quantity,
+            OrderItem.c.price,
+        )
+        .join(Product, Product.c.id == OrderItem.c.product_id)
+        .where(OrderItem.c.order_id.in_(order_ids))
+        .order_by(OrderItem.c.order_id, OrderItem.c.id)
+    ):
+        lines[line.order_id].append(line)
+    for row in rows:
+        customer = _Customer(row.user_id, row.full_name, row.username, row.email)
+        yield build_invoice(row, customer, lines[row.id])
+
+
+def iter_invoices(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Stream the invoices of orders placed in [start, end) with ``status``, by order id."""
+    statement = select(
+        Order.c.id,
+        Order.c.created_at,
+        Order.c.status,
+        Order.c.shipping_address,
+        Order.c.total_amount,
+        Order.c.user_id,
+        User.c.full_name,
+        User.c.username,
+        User.c.email,
+    ).join(User, User.c.id == Order.c.user_id).order_by(Order.c.id)
+    if start is not None:
+        statement = statement.where(Order.c.created_at >= start)
+    if end is not None:
+        statement = statement.where(Order.c.created_at < end)
+    if status:
+        statement = statement.where(Order.c.status == status)
+    return stream_batches(statement, process=_invoice_batch)
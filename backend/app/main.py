@@ -1,20 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from app.database import engine, Base, close_ssh_tunnel
-from app.routers import products, auth, cart, orders, chatbot
+from app.database import check_database, close_engines, start_pool_validation, get_pool_stats
+from app.migrations import DB_AUTO_MIGRATE, upgrade_database
+from app.routers import products, auth, cart, orders, chatbot, profiles
+from app.passwords import hasher
+from app.pagination import NEXT_CURSOR_HEADER
+from app import metrics, profiling, query_stats
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    # Create database tables
-    Base.metadata.create_all(bind=engine)
+    # Bring the schema up to date (see backend/alembic)
+    if DB_AUTO_MIGRATE:
+        upgrade_database()
+    start_pool_validation()
     yield
     # Shutdown
-    close_ssh_tunnel()
+    hasher.shutdown()
+    await close_engines()
 
 app = FastAPI(title="E-Commerce API", version="1.0.0", lifespan=lifespan)
 
+# Per-request query count, DB time and N+1 detection
+query_stats.install()
+app.add_middleware(query_stats.QueryStatsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -22,14 +34,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, *query_stats.DEBUG_HEADERS, profiling.PROFILE_ID_HEADER],
 )
 
+# Request counts and latency per route, served at /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# On-demand request profiles; not installed unless PROFILING_TOKEN or
+# PROFILING_SAMPLE_RATE is set
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 app.include_router(cart.router, prefix="/api/cart", tags=["cart"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(chatbot.router, prefix="/api/chatbot", tags=["chatbot"])
+if profiling.PROFILING_ENABLED:
+    app.include_router(profiles.router, prefix=profiling.PROFILES_PATH, include_in_schema=False)
 
 @app.get("/")
 async def root():
@@ -37,5 +60,25 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"}
+    """Readiness: healthy only when the database answers through the connection pool"""
+    error = await check_database()
+    if error is not None:
+        return JSONResponse(status_code=503, content={"status": "unhealthy", "database": error})
+    return {"status": "healthy", "database": "ok"}
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness: the process is serving requests, whatever the state of the database"""
+    return {"status": "alive"}
+
+@app.get("/api/health/pool")
+async def pool_health():
+    return get_pool_stats()
+
+@app.get("/api/health/hashing")
+async def hashing_health():
+    return hasher.stats()
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
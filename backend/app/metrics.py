@@ -0,0 +1,231 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware counts requests per route template, method and status code,
+records their latency in a LatencyHistogram and tracks requests in flight.
+The middleware runs on the event loop thread, so the counters are plain ints
+updated without locks, and a request allocates nothing beyond its lookup key.
+Connection pool, cache and password hashing gauges are read when /metrics is
+scraped. ``render`` produces the text exposition format (version 0.0.4).
+
+Latency percentiles are best computed by Prometheus with histogram_quantile
+over http_request_duration_seconds_bucket; http_request_duration_quantile_seconds
+gives the same estimate over the process lifetime for quick inspection.
+"""
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.pool import QueuePool
+
+from app import database
+from app.auth import user_cache
+from app.cache import catalog_cache
+from app.identifiers import identifier_cache
+from app.passwords import hasher
+from app.pool import LatencyHistogram
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# The response adds "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Label of requests that matched no route, so that scans of random URLs do
+# not create a series each
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "statuses")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[int, int] = {}
+
+
+_routes: Dict[Tuple[str, str], RouteMetrics] = {}
+_in_flight = 0
+
+
+def observe(method: str, route: str, status_code: int, seconds: float):
+    metrics = _routes.get((method, route))
+    if metrics is None:
+        metrics = _routes[(method, route)] = RouteMetrics()
+    metrics.latency.observe(seconds)
+    metrics.statuses[status_code] = metrics.statuses.get(status_code, 0) + 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight
+        _in_flight += 1
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _in_flight -= 1
+            # The router stores the matched route in the (shared) scope
+            route = scope.get("route")
+            observe(
+                scope["method"],
+                route.path if route is not None else UNMATCHED_ROUTE,
+                status_code,
+                time.perf_counter() - start,
+            )
+
+
+# ---------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _header(lines: List[str], name: str, metric_type: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _histogram_samples(lines: List[str], name: str, labels: Dict[str, object], histogram: LatencyHistogram):
+    running = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        running += count
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound / 1000})} {running}")
+    lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.total}")
+    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum_ms / 1000}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.total}")
+
+
+def estimate_quantile(histogram: LatencyHistogram, quantile: float) -> Optional[float]:
+    """Estimate a latency quantile (seconds) by interpolating within its bucket, like histogram_quantile."""
+    if not histogram.total:
+        return None
+    rank = quantile * histogram.total
+    running = 0
+    lower = 0.0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        if count and running + count >= rank:
+            return (lower + (bound - lower) * (rank - running) / count) / 1000
+        running += count
+        lower = bound
+    # Quantile in the +Inf bucket: report the largest finite bound
+    return histogram.buckets[-1] / 1000
+
+
+def _render_requests(lines: List[str]):
+    routes = sorted(_routes.items())
+
+    _header(lines, "http_requests_total", "counter", "HTTP requests by route template, method and status code.")
+    for (method, route), metrics in routes:
+        for status_code, count in sorted(metrics.statuses.items()):
+            lines.append(f"http_requests_total{_labels({'method': method, 'route': route, 'status': status_code})} {count}")
+
+    _header(lines, "http_request_duration_seconds", "histogram", "HTTP request latency by route template and method.")
+    for (method, route), metrics in routes:
+        _histogram_samples(lines, "http_request_duration_seconds", {"method": method, "route": route}, metrics.latency)
+
+    _header(lines, "http_request_duration_quantile_seconds", "gauge", "Latency percentiles since start, estimated from the histogram buckets.")
+    for (method, route), metrics in routes:
+        for quantile in QUANTILES:
+            value = estimate_quantile(metrics.latency, quantile)
+            if value is not None:
+                labels = {"method": method, "route": route, "quantile": quantile}
+                lines.append(f"http_request_duration_quantile_seconds{_labels(labels)} {value}")
+
+    _header(lines, "http_requests_in_flight", "gauge", "HTTP requests currently being served.")
+    lines.append(f"http_requests_in_flight {_in_flight}")
+
+
+def _pools() -> Iterable[Tuple[str, QueuePool]]:
+    pools = [("sync", database.engine.pool)]
+    if database.async_engine is not None:
+        pools.append(("async", database.async_engine.sync_engine.pool))
+    # Only queue pools have a size and overflow to report
+    return [(name, pool) for name, pool in pools if isinstance(pool, QueuePool)]
+
+
+def _render_pools(lines: List[str]):
+    pools = list(_pools())
+    for name, help_text, read in (
+        ("db_pool_size", "Configured connection pool size.", lambda pool: pool.size()),
+        ("db_pool_checked_out", "Connections currently checked out.", lambda pool: pool.checkedout()),
+        ("db_pool_checked_in", "Idle connections in the pool.", lambda pool: pool.checkedin()),
+        ("db_pool_overflow", "Connections open beyond the pool size.", lambda pool: max(pool.overflow(), 0)),
+    ):
+        _header(lines, name, "gauge", help_text)
+        for engine, pool in pools:
+            lines.append(f"{name}{_labels({'engine': engine})} {read(pool)}")
+
+    _header(lines, "db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection.")
+    for engine, pool in pools:
+        histogram = getattr(pool, "wait_histogram", None)
+        if histogram is not None:
+            _histogram_samples(lines, "db_pool_checkout_wait_seconds", {"engine": engine}, histogram)
+
+
+def _caches() -> Iterable[Tuple[str, object]]:
+    yield "user", user_cache
+    yield "identifier", identifier_cache
+    # A shared response cache backend may not keep statistics
+    if hasattr(catalog_cache.backend, "stats"):
+        yield "catalog", catalog_cache.backend
+
+
+def _render_caches(lines: List[str]):
+    stats = [(name, cache.stats()) for name, cache in _caches()]
+    for name, metric_type, help_text, read in (
+        ("cache_hits_total", "counter", "Cache lookups that found a live entry.", lambda s: s["hits"]),
+        ("cache_misses_total", "counter", "Cache lookups that found nothing or an expired entry.", lambda s: s["misses"]),
+        ("cache_entries", "gauge", "Entries currently cached.", lambda s: s["size"]),
+        ("cache_hit_ratio", "gauge", "Hits over lookups since start.", lambda s: s["hits"] / ((s["hits"] + s["misses"]) or 1)),
+    ):
+        _header(lines, name, metric_type, help_text)
+        for cache, values in stats:
+            lines.append(f"{name}{_labels({'cache': cache})} {read(values)}")
+
+
+def _render_hashing(lines: List[str]):
+    for name, metric_type, help_text, value in (
+        ("password_hash_workers", "gauge", "Password hashing worker processes.", hasher.workers),
+        ("password_hash_queue_limit", "gauge", "Pending hash operations accepted before answering 503.", hasher.max_queue),
+        ("password_hash_pending", "gauge", "Hash operations queued or running.", hasher.pending),
+        ("password_hash_rejected_total", "counter", "Hash operations rejected because the queue was full.", hasher.rejected),
+    ):
+        _header(lines, name, metric_type, help_text)
+        lines.append(f"{name} {value}")
+    _header(lines, "password_hash_duration_seconds", "histogram", "Password hash and verify latency, including queueing.")
+    _histogram_samples(lines, "password_hash_duration_seconds", {}, hasher.latency)
+
+
+def render() -> str:
+    lines: List[str] = []
+    _render_requests(lines)
+    _render_pools(lines)
+    _render_caches(lines)
+    _render_hashing(lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,50 @@
+"""
+Schema migrations.
+
+The schema is managed by the Alembic history in backend/alembic.
+``upgrade_database`` brings the database to the latest revision; the API runs
+it on startup (unless DB_AUTO_MIGRATE is off) and so do the maintenance
+scripts. Databases created with Base.metadata.create_all before the history
+existed have tables but no alembic_version and are stamped with the baseline
+revision first.
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import inspect, text
+
+from app import database
+
+logger = logging.getLogger(__name__)
+
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_REVISION = "0001"
+
+# pg_advisory_xact_lock key serializing workers that start at the same time
+_MIGRATION_LOCK_ID = 4801
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.attributes["connection"] = connection
+    return config
+
+
+def upgrade_database(bind=None):
+    """Upgrade the database behind ``bind`` (default: app.database.engine) to the latest revision."""
+    bind = bind if bind is not None else database.engine
+    with bind.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _MIGRATION_LOCK_ID})
+        config = alembic_config(connection)
+        current = MigrationContext.configure(connection).get_current_revision()
+        if current is None and inspect(connection).has_table("users"):
+            logger.info(f"Stamping existing schema with baseline revision {BASELINE_REVISION}")
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
@@ -1,8 +1,31 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, Index, UniqueConstraint, literal_column
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
+# Text search configuration used for the products full-text index. Queries
+# must build the exact same expression (see product_search_vector) for
+# PostgreSQL to pick the expression index.
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+
+# Column type of the server-stamped created_at columns. SQLite stores
+# CURRENT_TIMESTAMP as text without fractional seconds, while SQLAlchemy binds
+# datetimes with microseconds; keyset cursors compare the two as strings, so
+# binds use the same format there.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+def product_search_vector(name, description, category):
+    """Weighted tsvector over a product's name (A), category (B) and description (C)."""
+    def weighted(column, weight):
+        return func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, "")), weight)
+    return weighted(name, "A").op("||")(weighted(category, "B")).op("||")(weighted(description, "C"))
+
 class User(Base):
     __tablename__ = "users"
     
@@ -12,7 +35,7 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     full_name = Column(String)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     cart_items = relationship("CartItem", back_populates="user")
     orders = relationship("Order", back_populates="user")
@@ -21,7 +44,8 @@ class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False, index=True)
+    # Unique: the bulk catalog import upserts on the product name
+    name = Column(String, nullable=False, unique=True, index=True)
     description = Column(Text)
     price = Column(Float, nullable=False)
     image_url = Column(String)
@@ -29,23 +53,43 @@ class Product(Base):
     stock = Column(Integer, default=0)
     rating = Column(Float, default=0.0)
     review_count = Column(Integer, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     cart_items = relationship("CartItem", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
 
+    __table_args__ = (
+        # GIN index backing app.search on PostgreSQL; other dialects use the
+        # in-process fallback index instead.
+        Index(
+            "ix_products_search",
+            product_search_vector(name, description, category),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        # Keyset pagination orders (see routers/products.get_products)
+        Index("ix_products_price_id", price, id),
+        Index("ix_products_rating_id", rating, id),
+        Index("ix_products_created_at_id", created_at, id),
+    )
+
 class CartItem(Base):
     __tablename__ = "cart_items"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Lookups by user_id use the leading column of uq_cart_items_user_product
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     quantity = Column(Integer, default=1)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     user = relationship("User", back_populates="cart_items")
     product = relationship("Product", back_populates="cart_items")
 
+    __table_args__ = (
+        # One row per product in a user's cart; target of the add-to-cart upsert
+        UniqueConstraint("user_id", "product_id", name="uq_cart_items_user_product"),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
     
@@ -54,20 +98,55 @@ class Order(Base):
     total_amount = Column(Float, nullable=False)
     status = Column(String, default="pending")  # pending, processing, shipped, delivered, cancelled
     shipping_address = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     user = relationship("User", back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        # Order history keyset pagination (see app.order_history); also serves
+        # every other lookup by user_id
+        Index("ix_orders_user_created_at_id", user_id, created_at, id),
+        # Chatbot orders-by-status listing, newest first
+        Index("ix_orders_status_created_at", status, created_at),
+        # Date-range invoice exports
+        Index("ix_orders_created_at", created_at),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
     
     order = relationship("Order", back_populates="order_items")
     product = relationship("Product", back_populates="order_items")
 
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    response_body = Column(Text)
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        # Claimed inside the order transaction, so concurrent retries with the
+        # same key wait on this index instead of placing a second order
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+
+class UserOrderStats(Base):
+    """Per-user, per-status order counts maintained by app.order_stats."""
+    __tablename__ = "user_order_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_spent = Column(Float, nullable=False, default=0.0)
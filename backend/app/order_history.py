@@ -0,0 +1,77 @@
+"""
+Paginated order history.
+
+Orders are listed newest first with keyset pagination on (created_at, id).
+Line items are fetched with one extra IN query for the whole page and only
+carry the product columns in schemas.OrderProductSummary, so long order
+histories no longer multiply full product rows (descriptions included) into
+a single joined result.
+"""
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+
+from app import models
+from app.pagination import NEXT_CURSOR_HEADER, apply_keyset, encode_cursor
+
+ORDER_HISTORY_SORT = "-created_at"
+
+_ITEM_COLUMNS = (
+    models.OrderItem.id,
+    models.OrderItem.order_id,
+    models.OrderItem.product_id,
+    models.OrderItem.quantity,
+    models.OrderItem.price,
+)
+_PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.price,
+    models.Product.image_url,
+    models.Product.category,
+)
+
+
+def _page(query, limit: int, cursor: Optional[str]) -> Tuple[list, Dict[str, str]]:
+    query = apply_keyset(
+        query, ORDER_HISTORY_SORT, models.Order.created_at, models.Order.id, cursor, descending=True
+    )
+    rows = query.limit(limit + 1).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(ORDER_HISTORY_SORT, last.created_at, last.id)
+    return rows, headers
+
+
+def list_orders(db: Session, user_id: int, limit: int, cursor: Optional[str] = None):
+    """One page of a user's orders with their line items; returns (orders, headers)."""
+    query = db.query(models.Order).options(
+        selectinload(models.Order.order_items)
+        .load_only(*_ITEM_COLUMNS)
+        .joinedload(models.OrderItem.product)
+        .load_only(*_PRODUCT_COLUMNS)
+    ).filter(models.Order.user_id == user_id)
+    return _page(query, limit, cursor)
+
+
+def list_order_summaries(db: Session, user_id: int, limit: int, cursor: Optional[str] = None):
+    """One page of a user's orders without line items, with an item count instead."""
+    item_count = (
+        select(func.count(models.OrderItem.id))
+        .where(models.OrderItem.order_id == models.Order.id)
+        .correlate(models.Order)
+        .scalar_subquery()
+    )
+    query = db.query(
+        models.Order.id,
+        models.Order.user_id,
+        models.Order.total_amount,
+        models.Order.status,
+        models.Order.shipping_address,
+        models.Order.created_at,
+        item_count.label("item_count"),
+    ).filter(models.Order.user_id == user_id)
+    return _page(query, limit, cursor)
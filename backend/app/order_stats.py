@@ -0,0 +1,97 @@
+"""
+Per-user order statistics.
+
+By default the stats are computed with one GROUP BY status aggregate over the
+user's orders. With ORDER_STATS_MATERIALIZED enabled, order creation and
+status changes also keep a user_order_stats row per (user, status) up to
+date in the same transaction, and reads come from those rows instead. Run
+``python rebuild_order_stats.py`` after enabling it (or after changing order
+statuses outside the API) to rebuild the rows from the orders table.
+"""
+import os
+from typing import Dict
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import upsert_insert
+
+ORDER_STATS_MATERIALIZED = os.getenv("ORDER_STATS_MATERIALIZED", "false").lower() in ("1", "true", "yes")
+
+orders = models.Order.__table__
+user_order_stats = models.UserOrderStats.__table__
+
+
+def _summarize(rows) -> Dict:
+    status_breakdown = {}
+    total_orders = 0
+    total_spent = 0.0
+    for status, order_count, spent in rows:
+        if not order_count:
+            continue
+        status_breakdown[status] = order_count
+        total_orders += order_count
+        total_spent += spent or 0.0
+    return {
+        "total_orders": total_orders,
+        "total_spent": total_spent,
+        "status_breakdown": status_breakdown,
+    }
+
+
+def get_order_stats(db: Session, user_id: int) -> Dict:
+    """Return total_orders, total_spent and status_breakdown for a user."""
+    if ORDER_STATS_MATERIALIZED:
+        query = select(
+            user_order_stats.c.status,
+            user_order_stats.c.order_count,
+            user_order_stats.c.total_spent,
+        ).where(user_order_stats.c.user_id == user_id)
+    else:
+        query = select(
+            orders.c.status,
+            func.count(),
+            func.sum(orders.c.total_amount),
+        ).where(orders.c.user_id == user_id).group_by(orders.c.status)
+    return _summarize(db.execute(query).all())
+
+
+def _apply(db: Session, user_id: int, status: str, count: int, amount: float):
+    stmt = upsert_insert(db, user_order_stats).values(
+        user_id=user_id, status=status, order_count=count, total_spent=amount
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[user_order_stats.c.user_id, user_order_stats.c.status],
+        set_={
+            "order_count": user_order_stats.c.order_count + stmt.excluded.order_count,
+            "total_spent": user_order_stats.c.total_spent + stmt.excluded.total_spent,
+        },
+    ))
+
+
+def record_order(db: Session, user_id: int, status: str, amount: float):
+    """Count a new order; call inside the transaction that inserts it."""
+    if ORDER_STATS_MATERIALIZED:
+        _apply(db, user_id, status, 1, amount)
+
+
+def record_status_change(db: Session, user_id: int, old_status: str, new_status: str, amount: float):
+    """Move an order between statuses; call inside the transaction that updates it."""
+    if ORDER_STATS_MATERIALIZED and old_status != new_status:
+        _apply(db, user_id, old_status, -1, -amount)
+        _apply(db, user_id, new_status, 1, amount)
+
+
+def rebuild(db: Session):
+    """Recompute every user_order_stats row from the orders table."""
+    db.execute(delete(user_order_stats))
+    db.execute(insert(user_order_stats).from_select(
+        ["user_id", "status", "order_count", "total_spent"],
+        select(
+            orders.c.user_id,
+            orders.c.status,
+            func.count(),
+            func.coalesce(func.sum(orders.c.total_amount), 0.0),
+        ).group_by(orders.c.user_id, orders.c.status),
+    ))
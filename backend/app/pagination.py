@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token holding the sort key and the values of
+the last row of the previous page. Pages are fetched with a row-value
+comparison on (sort column, id), which the matching composite index serves
+directly no matter how deep the page is.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort: str, value: Any, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps([sort, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        row_id = int(row_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+    return value, row_id
+
+
+def apply_keyset(query, sort: str, column, id_column, cursor: Optional[str], descending: bool = False):
+    """Order ``query`` by (column, id) and start after ``cursor`` when given."""
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        if column is id_column:
+            key, bound = id_column, row_id
+        else:
+            # Bind with the column types so values are rendered the way the
+            # dialect stores them (e.g. SQLite datetime strings).
+            key = tuple_(column, id_column)
+            bound = tuple_(literal(value, column.type), literal(row_id, id_column.type))
+        query = query.filter(key < bound if descending else key > bound)
+
+    if column is id_column:
+        order = [id_column.desc() if descending else id_column]
+    elif descending:
+        order = [column.desc(), id_column.desc()]
+    else:
+        order = [column, id_column]
+    return query.order_by(*order)
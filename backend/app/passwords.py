@@ -0,0 +1,124 @@
+"""
+Password hashing on a dedicated process pool.
+
+bcrypt burns a few hundred milliseconds of CPU per call. Running it inside a
+request would hold the GIL (or a threadpool slot) for that long, so the async
+helpers below hand it to a size-limited ProcessPoolExecutor and reject new work
+with a 503 once too many operations are queued.
+
+This module is imported by the worker processes, so it must not import
+app.database or anything else that opens connections.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.pool import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hashing operations allowed in flight (running + queued) before answering 503.
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "64"))
+
+# Hashes with a different cost than BCRYPT_ROUNDS are flagged by
+# verify_and_update and transparently rehashed on the next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.rejected = 0
+        self.latency = LatencyHistogram()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs the event loop and
+            # threadpool threads is not safe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        # Only touched from the event loop thread, so no lock is needed.
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Password hashing queue full ({self.pending} pending), rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy. Please try again shortly.",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next request.
+            logger.error("Password hashing worker pool broke, restarting it")
+            self.shutdown()
+            raise
+        finally:
+            self.pending -= 1
+            self.latency.observe(time.perf_counter() - start)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Return (valid, new_hash); new_hash is set when the stored hash needs upgrading."""
+        return await self._submit(_verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "latency": self.latency.snapshot(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                # No cancel_futures before 3.9, and exiting after a
+                # non-waiting shutdown can hang there. Called at exit or
+                # after the pool broke, so there is little to wait for.
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(workers=HASH_WORKERS, max_queue=HASH_MAX_QUEUE)
@@ -0,0 +1,135 @@
+"""
+Connection pool instrumentation.
+
+The engines in app.database use the pool classes below so that the time spent
+waiting for a connection is recorded, and so that idle connections can be
+validated by a background thread instead of pinging on every checkout.
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (milliseconds) of the latency histogram buckets.
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Cumulative histogram of operation latencies (connection checkouts, password hashing)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def snapshot(self) -> dict:
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            buckets[f"le_{bound}ms"] = running
+        buckets["le_inf"] = self.total
+        return {
+            "count": self.total,
+            "sum_ms": round(self.sum_ms, 3),
+            "buckets": buckets,
+        }
+
+
+class _TimedCheckout:
+    """Records how long each checkout (queueing, connecting, pre-ping) takes."""
+
+    wait_histogram: LatencyHistogram
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.wait_histogram.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    wait_histogram = LatencyHistogram()
+
+    def validate_idle(self) -> int:
+        """
+        Ping every idle pooled connection, invalidating the ones that fail so
+        they reconnect on their next checkout. Returns the number checked.
+        """
+        checked = 0
+        for _ in range(self._pool.qsize()):
+            try:
+                record = self._pool.get(False)
+            except Exception:
+                # Queue drained by concurrent checkouts
+                break
+            try:
+                if record.dbapi_connection is not None:
+                    self._dialect.do_ping(record.dbapi_connection)
+            except Exception as e:
+                logger.warning(f"Discarding stale pooled connection: {e}")
+                record.invalidate(e)
+            finally:
+                self._do_return_conn(record)
+            checked += 1
+        return checked
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    wait_histogram = LatencyHistogram()
+
+
+def pool_status(pool) -> dict:
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    histogram = getattr(pool, "wait_histogram", None)
+    if histogram is not None:
+        status["checkout_wait"] = histogram.snapshot()
+    return status
+
+
+class PoolValidator:
+    """Daemon thread that periodically validates idle connections of a pool."""
+
+    def __init__(self, get_pool: Callable[[], InstrumentedQueuePool], interval: float):
+        self.get_pool = get_pool
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="db-pool-validator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.get_pool().validate_idle()
+            except Exception as e:
+                logger.error(f"Pool validation failed: {e}")
@@ -0,0 +1,319 @@
+"""
+On-demand request profiling.
+
+ProfilingMiddleware profiles requests that carry PROFILING_HEADER with the
+value of PROFILING_TOKEN, plus a random PROFILING_SAMPLE_RATE fraction of all
+requests. A profile is a wall-clock sampling profile of that one request: a
+sampler thread looks at the request every PROFILING_INTERVAL_MS and records
+where it is
+
+- running on the event loop thread (handlers, dependencies, Pydantic
+  serialization, DB_ASYNC greenlets running SQLAlchemy code): the stack of the
+  loop thread, from the request's coroutine down;
+- waiting for a threadpool worker (sync handlers and dependencies): the await
+  chain followed by the stack of that worker thread;
+- awaiting anything else (database I/O on the async engine, bcrypt in the
+  password hashing processes, the client): the await chain, ending in
+  "(waiting)".
+
+Other requests served at the same time are not included. Profiles are written
+to PROFILING_DIR in the collapsed stack format read by flamegraph.pl,
+speedscope and inferno, next to a JSON file describing the request; the
+response carries their id in PROFILE_ID_HEADER. With neither a token nor a
+sample rate configured the middleware is not installed at all.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    # Installed with SQLAlchemy's asyncio support (DB_ASYNC)
+    import greenlet
+except ImportError:
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "2"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "api-profiles"))
+# Oldest profiles are deleted beyond this many
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "100"))
+PROFILING_ENABLED = bool(PROFILING_TOKEN) or PROFILING_SAMPLE_RATE > 0
+
+PROFILING_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Where the stored profiles are served; requests for them are never profiled
+PROFILES_PATH = "/api/debug/profiles"
+
+WAITING_FRAME = "(waiting)"
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STDLIB_DIR = os.path.dirname(os.__file__)
+# Frames of the thread machinery around the code a worker thread runs
+_THREAD_INTERNALS = (threading.__file__, queue.__file__, os.sep + "anyio" + os.sep)
+
+
+def token_matches(token: Optional[str]) -> bool:
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+# ---------------------------------------------------------
+# Sampler
+# ---------------------------------------------------------
+
+_labels: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if "site-packages" + os.sep in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[1]
+        elif filename.startswith(_BACKEND_DIR + os.sep):
+            filename = os.path.relpath(filename, _BACKEND_DIR)
+        elif filename.startswith(_STDLIB_DIR + os.sep):
+            filename = os.path.relpath(filename, _STDLIB_DIR)
+        # co_qualname is new in Python 3.11; ";" separates frames in the collapsed format
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+    return label
+
+
+def _thread_frames(frame) -> List:
+    """Frames of a thread stack, outermost first."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> List:
+    """Frames of a suspended coroutine and of everything it awaits, outermost first."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+def _worker_thread(frames) -> Optional[threading.Thread]:
+    # anyio's run_sync (used by run_in_threadpool) keeps the worker thread it
+    # handed the call to in a local while awaiting the result
+    for frame in reversed(frames):
+        worker = frame.f_locals.get("worker")
+        if isinstance(worker, threading.Thread):
+            return worker
+    return None
+
+
+class RequestProfiler:
+    """Samples what one asyncio task is doing from a background thread."""
+
+    def __init__(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop, interval: float):
+        self.task = task
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.loop_greenlet = greenlet.getcurrent() if greenlet is not None else None
+        self.root = task.get_coro().cr_frame
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                stack = self._sample()
+            except Exception:
+                # Frames can change under the sampler; skip the sample
+                continue
+            if stack:
+                self.samples[stack] += 1
+
+    def _sample(self) -> Tuple[str, ...]:
+        if asyncio.current_task(self.loop) is self.task:
+            frames = _thread_frames(sys._current_frames().get(self.loop_thread))
+            if self.root not in frames and self.loop_greenlet is not None:
+                # Running in a greenlet spawned by SQLAlchemy (DB_ASYNC): its
+                # stack starts fresh, the coroutines that spawned it are in
+                # the suspended main greenlet.
+                frames = _thread_frames(self.loop_greenlet.gr_frame) + frames
+            if self.root in frames:
+                # Drop the event loop frames above the request's coroutine
+                frames = frames[frames.index(self.root):]
+            return tuple(_label(frame.f_code) for frame in frames)
+
+        chain = _await_chain(self.task.get_coro())
+        stack = [_label(frame.f_code) for frame in chain]
+        worker = _worker_thread(chain)
+        thread_frames = _thread_frames(sys._current_frames().get(worker.ident)) if worker is not None else []
+        thread_stack = [
+            _label(frame.f_code) for frame in thread_frames
+            if not any(internal in frame.f_code.co_filename for internal in _THREAD_INTERNALS)
+        ]
+        if thread_stack:
+            stack += thread_stack
+        else:
+            stack.append(WAITING_FRAME)
+        return tuple(stack)
+
+
+# ---------------------------------------------------------
+# Storage
+# ---------------------------------------------------------
+
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(PROFILING_DIR, f"{profile_id}.{extension}")
+
+
+def save_profile(profile_id: str, root: str, samples: Counter, metadata: Dict):
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    with open(_path(profile_id, "folded"), "w") as f:
+        for stack, count in samples.most_common():
+            f.write(";".join((root, *stack)) + f" {count}\n")
+    with open(_path(profile_id, "json"), "w") as f:
+        json.dump(metadata, f)
+    _prune()
+
+
+def _profile_ids() -> List[str]:
+    try:
+        names = os.listdir(PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    # Ids start with a millisecond timestamp, so they sort by age
+    return sorted(name[:-len(".json")] for name in names if name.endswith(".json"))
+
+
+def _prune():
+    for profile_id in _profile_ids()[:-PROFILING_MAX_PROFILES or None]:
+        for extension in ("folded", "json"):
+            try:
+                os.remove(_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict]:
+    """Metadata of the stored profiles, newest first."""
+    profiles = []
+    for profile_id in reversed(_profile_ids()):
+        try:
+            with open(_path(profile_id, "json")) as f:
+                profiles.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return profiles
+
+
+def read_profile(profile_id: str) -> Optional[str]:
+    """Collapsed stacks of a stored profile, or None."""
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    try:
+        with open(_path(profile_id, "folded")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+# ---------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that ask for it or are sampled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(PROFILES_PATH):
+            await self.app(scope, receive, send)
+            return
+        if token_matches(Headers(scope=scope).get(PROFILING_HEADER)):
+            trigger = "header"
+        elif PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+            trigger = "sample"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.time_ns() // 1_000_000}-{secrets.token_hex(4)}"
+        profiler = RequestProfiler(asyncio.current_task(), asyncio.get_running_loop(), PROFILING_INTERVAL_MS / 1000)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            duration = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = route.path if route is not None else scope["path"]
+            metadata = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_path,
+                "status": status_code,
+                "trigger": trigger,
+                "duration_ms": round(duration * 1000, 1),
+                "samples": 0,
+                "interval_ms": PROFILING_INTERVAL_MS,
+                "created_at": time.time(),
+            }
+            await run_in_threadpool(self._finish, profiler, f"{scope['method']} {route_path}", metadata)
+
+    @staticmethod
+    def _finish(profiler: RequestProfiler, root: str, metadata: Dict):
+        profiler.join()
+        metadata["samples"] = sum(profiler.samples.values())
+        try:
+            save_profile(metadata["id"], root, profiler.samples, metadata)
+        except OSError as e:
+            logger.error(f"Could not store profile {metadata['id']}: {str(e)}")
+            return
+        logger.info(
+            f"Profiled {root} ({metadata['trigger']}): {metadata['duration_ms']} ms, "
+            f"{metadata['samples']} samples, id {metadata['id']}"
+        )
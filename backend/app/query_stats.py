@@ -0,0 +1,207 @@
+"""
+Per-request SQL instrumentation.
+
+Engine events record every statement a request executes (on the sync and
+async engines alike) into a QueryStats object held in a context variable, which
+the worker threads and greenlets serving the request inherit. At the end of
+the request QueryStatsMiddleware logs a structured summary: query count,
+total DB time, the slowest statements, statements repeated at least
+SQL_REPEATED_STATEMENT_THRESHOLD times (the signature of an N+1 pattern) and
+relationships that were lazy loaded. With SQL_DEBUG enabled the count and
+time are also sent as response headers and a Server-Timing entry.
+
+SQL_RAISE_ON_LAZY_LOAD makes any lazy load that emits SQL raise
+LazyLoadError; it is meant for development and CI, where it turns a missing
+joinedload/selectinload into an error instead of a silent extra query.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "true").lower() in ("1", "true", "yes")
+SQL_DEBUG = os.getenv("SQL_DEBUG", "false").lower() in ("1", "true", "yes")
+SQL_RAISE_ON_LAZY_LOAD = os.getenv("SQL_RAISE_ON_LAZY_LOAD", "false").lower() in ("1", "true", "yes")
+SQL_REPEATED_STATEMENT_THRESHOLD = int(os.getenv("SQL_REPEATED_STATEMENT_THRESHOLD", "5"))
+# Requests above either limit are logged as warnings
+SQL_MAX_QUERIES = int(os.getenv("SQL_MAX_QUERIES", "25"))
+SQL_SLOW_REQUEST_MS = float(os.getenv("SQL_SLOW_REQUEST_MS", "500"))
+SQL_SLOWEST_STATEMENTS = 3
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+DEBUG_HEADERS = [QUERY_COUNT_HEADER, QUERY_TIME_HEADER, "Server-Timing"]
+
+_STATEMENT_PREVIEW = 200
+
+
+class LazyLoadError(InvalidRequestError):
+    """A relationship was lazy loaded while SQL_RAISE_ON_LAZY_LOAD is enabled."""
+
+
+class QueryStats:
+    """Statements executed while serving one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # statement -> [executions, total seconds, slowest seconds, executemany]
+        self.statements: Dict[str, List] = {}
+        self.lazy_loads: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float, executemany: bool = False):
+        self.count += 1
+        self.duration += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed, elapsed, executemany]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def slowest(self, limit: int = SQL_SLOWEST_STATEMENTS) -> List[Tuple[str, float]]:
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+        return [(statement, entry[2]) for statement, entry in ranked[:limit]]
+
+    def repeated(self, threshold: int = SQL_REPEATED_STATEMENT_THRESHOLD) -> List[Tuple[str, int]]:
+        # Batches of one executemany (e.g. bulk imports) are expected repeats
+        return [
+            (statement, entry[0]) for statement, entry in self.statements.items()
+            if entry[0] >= threshold and not entry[3]
+        ]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    """Stats of the request being served, or None outside a request."""
+    return _current.get()
+
+
+def _preview(statement: str) -> str:
+    return " ".join(statement.split())[:_STATEMENT_PREVIEW]
+
+
+# ---------------------------------------------------------
+# SQLAlchemy events
+# ---------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, "_query_stats_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start, executemany)
+
+
+def _on_orm_execute(execute_state):
+    if not execute_state.is_select or execute_state.lazy_loaded_from is None:
+        return
+    relationship = str(execute_state.loader_strategy_path[-1])
+    if SQL_RAISE_ON_LAZY_LOAD:
+        raise LazyLoadError(
+            f"Lazy load of {relationship}; load it up front with joinedload() or selectinload()"
+        )
+    stats = _current.get()
+    if stats is not None:
+        stats.lazy_loads[relationship] += 1
+
+
+def install():
+    """Register the engine and session listeners (once)."""
+    if not SQL_INSTRUMENTATION or event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    # Listening on the classes covers app.database.engine as well as the
+    # sync engine behind the asyncpg AsyncEngine.
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Session, "do_orm_execute", _on_orm_execute)
+
+
+# ---------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------
+
+class QueryStatsMiddleware:
+    """ASGI middleware collecting QueryStats for each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_INSTRUMENTATION:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+        status_code = 500
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SQL_DEBUG:
+                    # Streamed responses only count the queries run before
+                    # the body starts; the log line has the full totals.
+                    headers = MutableHeaders(scope=message)
+                    headers[QUERY_COUNT_HEADER] = str(stats.count)
+                    headers[QUERY_TIME_HEADER] = f"{stats.duration * 1000:.1f}"
+                    headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            _report(scope, status_code, stats)
+
+
+def _report(scope, status_code: int, stats: QueryStats):
+    if not stats.count and not stats.lazy_loads:
+        return
+    repeated = stats.repeated()
+    record = {
+        "event": "sql_request_stats",
+        "method": scope["method"],
+        "path": scope["path"],
+        "status": status_code,
+        "query_count": stats.count,
+        "db_time_ms": round(stats.duration * 1000, 1),
+        "slowest": [
+            {"statement": _preview(statement), "ms": round(elapsed * 1000, 1)}
+            for statement, elapsed in stats.slowest()
+        ],
+    }
+    if repeated:
+        record["repeated"] = [{"statement": _preview(statement), "count": count} for statement, count in repeated]
+    if stats.lazy_loads:
+        record["lazy_loads"] = dict(stats.lazy_loads)
+
+    flagged = (
+        repeated
+        or stats.lazy_loads
+        or stats.count > SQL_MAX_QUERIES
+        or stats.duration * 1000 >= SQL_SLOW_REQUEST_MS
+    )
+    logger.log(logging.WARNING if flagged else logging.INFO, json.dumps(record))
@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from app.database import get_db
-from app import models, schemas, auth
+from app.database import get_session, run_db
+from app import models, schemas, auth, identifiers, passwords
 import os
 import logging
 from dotenv import load_dotenv
@@ -15,41 +15,56 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+def _ensure_available(db: Session, user: schemas.UserCreate):
+    # Check if email already exists
+    if auth.get_user_by_email(db, email=user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
+    # Check if username already exists
+    if auth.get_user_by_username(db, username=user.username):
+        raise HTTPException(status_code=400, detail="Username already taken")
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    db_user = models.User(
+        email=user.email,
+        username=user.username,
+        hashed_password=hashed_password,
+        full_name=user.full_name
+    )
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    # Chatbot lookups may have cached this email/username as unknown
+    identifiers.forget_user(db_user)
+    return db_user
+
+def _store_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+    auth.invalidate_user(user.id)
+
+def _rollback(db: Session):
+    db.rollback()
+
 @router.post("/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db=Depends(get_session)):
     try:
-        # Check if email already exists
-        db_user = auth.get_user_by_email(db, email=user.email)
-        if db_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
-        # Check if username already exists
-        db_user = auth.get_user_by_username(db, username=user.username)
-        if db_user:
-            raise HTTPException(status_code=400, detail="Username already taken")
+        await run_db(db, _ensure_available, user)
         
-        # Create new user
-        hashed_password = auth.get_password_hash(user.password)
-        db_user = models.User(
-            email=user.email,
-            username=user.username,
-            hashed_password=hashed_password,
-            full_name=user.full_name
-        )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        # Create new user; bcrypt runs on the password worker pool
+        hashed_password = await passwords.hasher.hash(user.password)
+        db_user = await run_db(db, _create_user, user, hashed_password)
         logger.info(f"User registered successfully: {user.username} ({user.email})")
         return db_user
     
     except HTTPException:
         # Re-raise HTTP exceptions (like email/username already taken)
-        db.rollback()
+        await run_db(db, _rollback)
         raise
     
     except IntegrityError as e:
         # Handle database constraint violations
-        db.rollback()
+        await run_db(db, _rollback)
         logger.error(f"Database integrity error during registration: {str(e)}")
         error_msg = str(e.orig) if hasattr(e, 'orig') else str(e)
         if "email" in error_msg.lower() or "unique constraint" in error_msg.lower():
@@ -64,7 +79,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     
     except SQLAlchemyError as e:
         # Handle other database errors
-        db.rollback()
+        await run_db(db, _rollback)
         logger.error(f"Database error during registration: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -73,7 +88,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     
     except Exception as e:
         # Handle any other unexpected errors
-        db.rollback()
+        await run_db(db, _rollback)
         logger.error(f"Unexpected error during registration: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
@@ -81,20 +96,25 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         )
 
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_session)):
     try:
-        user = auth.authenticate_user(db, form_data.username, form_data.password)
-        if not user:
+        user = await run_db(db, auth.get_user_by_username, form_data.username)
+        valid, new_hash = False, None
+        if user:
+            valid, new_hash = await passwords.hasher.verify_and_update(form_data.password, user.hashed_password)
+        if not valid:
             logger.warning(f"Failed login attempt for username: {form_data.username}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if new_hash:
+            # Stored hash used outdated cost parameters
+            await run_db(db, _store_password_hash, user, new_hash)
+            logger.info(f"Rehashed password for user: {user.username}")
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = auth.create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
-        )
+        access_token = auth.create_user_token(user, expires_delta=access_token_expires)
         logger.info(f"User logged in successfully: {user.username}")
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
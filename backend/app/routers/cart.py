@@ -1,22 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete, update
 from sqlalchemy.orm import Session, joinedload
 from typing import List
-from app.database import get_db
-from app import models, schemas, auth
+from app.database import get_db, db_endpoint, upsert_insert
+from app import models, schemas, auth, serialization
 
-router = APIRouter()
+router = APIRouter(**serialization.router_options("cart"))
+
+cart_items = models.CartItem.__table__
+CART_ITEM_COLUMNS = (
+    cart_items.c.id,
+    cart_items.c.user_id,
+    cart_items.c.product_id,
+    cart_items.c.quantity,
+    cart_items.c.created_at,
+)
 
 @router.get("/", response_model=List[schemas.CartItemResponse])
-def get_cart(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+@db_endpoint
+def get_cart(current_user: schemas.TokenData = Depends(auth.get_token_user), db: Session = Depends(get_db)):
     cart_items = db.query(models.CartItem).options(
         joinedload(models.CartItem.product)
     ).filter(models.CartItem.user_id == current_user.id).all()
     return cart_items
 
+def _cart_item_response(row, product: models.Product) -> schemas.CartItemResponse:
+    return schemas.CartItemResponse(
+        id=row.id,
+        user_id=row.user_id,
+        product_id=row.product_id,
+        quantity=row.quantity,
+        created_at=row.created_at,
+        product=schemas.ProductResponse.model_validate(product),
+    )
+
 @router.post("/", response_model=schemas.CartItemResponse)
+@db_endpoint
 def add_to_cart(
     item: schemas.CartItemCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
     db: Session = Depends(get_db)
 ):
     # Check if product exists
@@ -24,61 +46,111 @@ def add_to_cart(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Check if item already in cart
-    existing_item = db.query(models.CartItem).filter(
-        models.CartItem.user_id == current_user.id,
-        models.CartItem.product_id == item.product_id
-    ).first()
-    
-    if existing_item:
-        existing_item.quantity += item.quantity
-        db.commit()
-        # Reload with product relationship
-        existing_item = db.query(models.CartItem).options(
-            joinedload(models.CartItem.product)
-        ).filter(models.CartItem.id == existing_item.id).first()
-        return existing_item
-    
-    cart_item = models.CartItem(
+    # Insert the line or atomically add to the quantity already in the cart
+    stmt = upsert_insert(db, cart_items).values(
         user_id=current_user.id,
         product_id=item.product_id,
         quantity=item.quantity
     )
-    db.add(cart_item)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[cart_items.c.user_id, cart_items.c.product_id],
+        set_={"quantity": cart_items.c.quantity + stmt.excluded.quantity}
+    ).returning(*CART_ITEM_COLUMNS)
+    cart_item = _cart_item_response(db.execute(stmt).one(), product)
     db.commit()
-    # Reload with product relationship
-    cart_item = db.query(models.CartItem).options(
-        joinedload(models.CartItem.product)
-    ).filter(models.CartItem.id == cart_item.id).first()
     return cart_item
 
+def _fold_operations(operations: List[schemas.CartOperation]):
+    """Collapse operations in order into one final action per product: ("add"|"set"|"remove", quantity)."""
+    final = {}
+    for operation in operations:
+        previous = final.get(operation.product_id)
+        if operation.op == "remove" or (operation.op == "set" and operation.quantity == 0):
+            final[operation.product_id] = ("remove", 0)
+        elif operation.op == "set":
+            final[operation.product_id] = ("set", operation.quantity)
+        elif previous is None or previous[0] == "add":
+            final[operation.product_id] = ("add", (previous[1] if previous else 0) + operation.quantity)
+        else:
+            # add after set/remove: the resulting quantity is known
+            final[operation.product_id] = ("set", previous[1] + operation.quantity)
+    return final
+
+@router.post("/batch", response_model=List[schemas.CartItemResponse])
+@db_endpoint
+def apply_cart_operations(
+    batch: schemas.CartBatchRequest,
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
+    db: Session = Depends(get_db)
+):
+    """Apply add/set/remove operations in one transaction and return the resulting cart"""
+    final = _fold_operations(batch.operations)
+    removes = [product_id for product_id, (action, _) in final.items() if action == "remove"]
+    upserts = {action: [
+        {"user_id": current_user.id, "product_id": product_id, "quantity": quantity}
+        for product_id, (op, quantity) in final.items() if op == action
+    ] for action in ("add", "set")}
+    
+    # Check that every product being added exists
+    wanted = {row["product_id"] for rows in upserts.values() for row in rows}
+    if wanted:
+        found = {product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.id.in_(wanted))}
+        missing = sorted(wanted - found)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Products not found: {missing}")
+    
+    if removes:
+        db.execute(
+            delete(cart_items).where(
+                cart_items.c.user_id == current_user.id,
+                cart_items.c.product_id.in_(removes)
+            )
+        )
+    for action, rows in upserts.items():
+        if not rows:
+            continue
+        stmt = upsert_insert(db, cart_items).values(rows)
+        quantity = stmt.excluded.quantity
+        if action == "add":
+            quantity = cart_items.c.quantity + quantity
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[cart_items.c.user_id, cart_items.c.product_id],
+            set_={"quantity": quantity}
+        ))
+    db.commit()
+    
+    return db.query(models.CartItem).options(
+        joinedload(models.CartItem.product)
+    ).filter(models.CartItem.user_id == current_user.id).all()
+
 @router.put("/{item_id}", response_model=schemas.CartItemResponse)
+@db_endpoint
 def update_cart_item(
     item_id: int,
-    quantity: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    quantity: int = Query(..., ge=1),
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
     db: Session = Depends(get_db)
 ):
-    cart_item = db.query(models.CartItem).filter(
-        models.CartItem.id == item_id,
-        models.CartItem.user_id == current_user.id
+    row = db.execute(
+        update(cart_items)
+        .where(cart_items.c.id == item_id, cart_items.c.user_id == current_user.id)
+        .values(quantity=quantity)
+        .returning(*CART_ITEM_COLUMNS)
     ).first()
     
-    if not cart_item:
+    if not row:
         raise HTTPException(status_code=404, detail="Cart item not found")
     
-    cart_item.quantity = quantity
+    product = db.query(models.Product).filter(models.Product.id == row.product_id).first()
+    cart_item = _cart_item_response(row, product)
     db.commit()
-    # Reload with product relationship
-    cart_item = db.query(models.CartItem).options(
-        joinedload(models.CartItem.product)
-    ).filter(models.CartItem.id == cart_item.id).first()
     return cart_item
 
 @router.delete("/{item_id}")
+@db_endpoint
 def remove_from_cart(
     item_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
     db: Session = Depends(get_db)
 ):
     cart_item = db.query(models.CartItem).filter(
@@ -94,8 +166,9 @@ def remove_from_cart(
     return {"message": "Item removed from cart"}
 
 @router.delete("/")
+@db_endpoint
 def clear_cart(
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
     db: Session = Depends(get_db)
 ):
     db.query(models.CartItem).filter(models.CartItem.user_id == current_user.id).delete()
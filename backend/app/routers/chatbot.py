@@ -1,53 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import update
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import List, Optional
-from app.database import get_db
-from app import models, schemas
+from datetime import date, datetime, time, timedelta
+from app.database import get_db, db_endpoint
+from app import models, schemas, auth, catalog, categories, identifiers, invoices, order_history, order_stats, serialization, streaming, search as product_search
+from app.cache import invalidate_catalog
 
-router = APIRouter()
+router = APIRouter(**serialization.router_options("chatbot"))
+
+order_table = models.Order.__table__
+order_item_table = models.OrderItem.__table__
+product_table = models.Product.__table__
 
 # Get user orders by user_id, email, or username
-@router.get("/orders/user/{identifier}", response_model=List[schemas.OrderResponse])
+@router.get("/orders/user/{identifier}", response_model=List[schemas.OrderHistoryResponse])
+@db_endpoint
 def get_user_orders_by_identifier(
-    identifier: str,
-    identifier_type: str = Query("auto", description="Type: 'id', 'email', 'username', or 'auto'"),
+    response: Response,
+    user_id: int = Depends(identifiers.user_id_from_identifier),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque X-Next-Cursor value from the previous page"),
     db: Session = Depends(get_db)
 ):
     """
     Get orders for a user by user_id, email, or username.
     If identifier_type is 'auto', it will try to detect the type.
     """
-    user = None
-    
-    if identifier_type == "auto":
-        # Try to detect type
-        if identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-        else:
-            # Try email first, then username
-            user = db.query(models.User).filter(models.User.email == identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == identifier).first()
-    elif identifier_type == "id":
-        user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-    elif identifier_type == "email":
-        user = db.query(models.User).filter(models.User.email == identifier).first()
-    elif identifier_type == "username":
-        user = db.query(models.User).filter(models.User.username == identifier).first()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid identifier_type. Use 'id', 'email', 'username', or 'auto'")
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    orders = db.query(models.Order).options(
-        joinedload(models.Order.order_items).joinedload(models.OrderItem.product)
-    ).filter(models.Order.user_id == user.id).order_by(models.Order.created_at.desc()).all()
-    
+    orders, headers = order_history.list_orders(db, user_id, limit, cursor)
+    response.headers.update(headers)
     return orders
 
 # Get specific order by order_id
 @router.get("/orders/{order_id}", response_model=schemas.OrderResponse)
+@db_endpoint
 def get_order_by_id(order_id: int, db: Session = Depends(get_db)):
     """Get order details by order ID"""
     order = db.query(models.Order).options(
@@ -62,9 +49,10 @@ def get_order_by_id(order_id: int, db: Session = Depends(get_db)):
 
 # Get orders by status
 @router.get("/orders/status/{status}", response_model=List[schemas.OrderResponse])
+@db_endpoint
 def get_orders_by_status(
     status: str,
-    user_identifier: Optional[str] = Query(None, description="Optional: filter by user (id, email, or username)"),
+    user_id: Optional[int] = Depends(identifiers.optional_user_id),
     db: Session = Depends(get_db)
 ):
     """Get orders by status, optionally filtered by user"""
@@ -74,189 +62,106 @@ def get_orders_by_status(
     
     query = query.filter(models.Order.status == status)
     
-    if user_identifier:
-        user = None
-        if user_identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(user_identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == user_identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == user_identifier).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        query = query.filter(models.Order.user_id == user.id)
+    if user_id is not None:
+        query = query.filter(models.Order.user_id == user_id)
     
     orders = query.order_by(models.Order.created_at.desc()).all()
     return orders
 
-# Get product details
-@router.get("/products/{product_id}", response_model=schemas.ProductResponse)
-def get_product_details(product_id: int, db: Session = Depends(get_db)):
-    """Get detailed product information"""
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
-
 # Search products
 @router.get("/products/search", response_model=List[schemas.ProductResponse])
+@db_endpoint
 def search_products(
     q: str = Query(..., description="Search query"),
     category: Optional[str] = Query(None, description="Filter by category"),
     limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
     db: Session = Depends(get_db)
 ):
-    """Search products by name or description"""
-    query = db.query(models.Product).filter(
-        models.Product.name.ilike(f"%{q}%") |
-        models.Product.description.ilike(f"%{q}%")
-    )
-    
-    if category:
-        query = query.filter(models.Product.category == category)
-    
-    products = query.limit(limit).all()
-    return products
+    """Search products by name, description or category, best matches first"""
+    return product_search.search_products(db, q, category=category, limit=limit)
 
 # Get products by category
 @router.get("/products/category/{category}", response_model=List[schemas.ProductResponse])
+@db_endpoint
 def get_products_by_category(
     category: str,
     limit: int = Query(50, ge=1, le=100),
     db: Session = Depends(get_db)
 ):
     """Get all products in a specific category"""
-    products = db.query(models.Product).filter(
+    products = catalog.query_products(db).filter(
         models.Product.category == category
     ).limit(limit).all()
     return products
 
 # Get all categories
 @router.get("/products/categories", response_model=List[str])
+@db_endpoint
 def get_all_categories(db: Session = Depends(get_db)):
     """Get list of all product categories"""
-    categories = db.query(models.Product.category).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+    return categories.get_category_names(db)
+
+# Get product details
+# Registered after the static /products/... routes so that "search" and
+# "categories" are not captured as a product_id.
+@router.get("/products/{product_id}", response_model=schemas.ProductResponse)
+@db_endpoint
+def get_product_details(product_id: int, db: Session = Depends(get_db)):
+    """Get detailed product information"""
+    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
 
 # Get user information
 @router.get("/users/{identifier}", response_model=schemas.UserResponse)
+@db_endpoint
 def get_user_info(
-    identifier: str,
-    identifier_type: str = Query("auto", description="Type: 'id', 'email', 'username', or 'auto'"),
+    user_id: int = Depends(identifiers.user_id_from_identifier),
     db: Session = Depends(get_db)
 ):
     """Get user information by user_id, email, or username"""
-    user = None
-    
-    if identifier_type == "auto":
-        if identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == identifier).first()
-    elif identifier_type == "id":
-        user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-    elif identifier_type == "email":
-        user = db.query(models.User).filter(models.User.email == identifier).first()
-    elif identifier_type == "username":
-        user = db.query(models.User).filter(models.User.username == identifier).first()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid identifier_type. Use 'id', 'email', 'username', or 'auto'")
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return user
+    return db.get(models.User, user_id)
 
 # Get user's cart items
 @router.get("/cart/{identifier}", response_model=List[schemas.CartItemResponse])
+@db_endpoint
 def get_user_cart(
-    identifier: str,
-    identifier_type: str = Query("auto", description="Type: 'id', 'email', 'username', or 'auto'"),
+    user_id: int = Depends(identifiers.user_id_from_identifier),
     db: Session = Depends(get_db)
 ):
     """Get user's cart items by user_id, email, or username"""
-    user = None
-    
-    if identifier_type == "auto":
-        if identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == identifier).first()
-    elif identifier_type == "id":
-        user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-    elif identifier_type == "email":
-        user = db.query(models.User).filter(models.User.email == identifier).first()
-    elif identifier_type == "username":
-        user = db.query(models.User).filter(models.User.username == identifier).first()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid identifier_type. Use 'id', 'email', 'username', or 'auto'")
-    
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     cart_items = db.query(models.CartItem).options(
         joinedload(models.CartItem.product)
-    ).filter(models.CartItem.user_id == user.id).all()
+    ).filter(models.CartItem.user_id == user_id).all()
     
     return cart_items
 
 # Get order statistics for a user
 @router.get("/orders/stats/{identifier}")
+@db_endpoint
 def get_user_order_stats(
-    identifier: str,
-    identifier_type: str = Query("auto", description="Type: 'id', 'email', 'username', or 'auto'"),
+    user_id: int = Depends(identifiers.user_id_from_identifier),
     db: Session = Depends(get_db)
 ):
     """Get order statistics for a user"""
-    user = None
-    
-    if identifier_type == "auto":
-        if identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == identifier).first()
-    elif identifier_type == "id":
-        user = db.query(models.User).filter(models.User.id == int(identifier)).first()
-    elif identifier_type == "email":
-        user = db.query(models.User).filter(models.User.email == identifier).first()
-    elif identifier_type == "username":
-        user = db.query(models.User).filter(models.User.username == identifier).first()
-    else:
-        raise HTTPException(status_code=400, detail="Invalid identifier_type. Use 'id', 'email', 'username', or 'auto'")
-    
+    user = db.get(models.User, user_id)
+    # The identifier cache can still hold the id of a since deleted user
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    orders = db.query(models.Order).filter(models.Order.user_id == user.id).all()
-    
-    total_orders = len(orders)
-    total_spent = sum(order.total_amount for order in orders)
-    status_counts = {}
-    for order in orders:
-        status_counts[order.status] = status_counts.get(order.status, 0) + 1
-    
     return {
         "user_id": user.id,
         "username": user.username,
         "email": user.email,
-        "total_orders": total_orders,
-        "total_spent": total_spent,
-        "status_breakdown": status_counts
+        **order_stats.get_order_stats(db, user.id)
     }
 
 # Cancel an order
 @router.post("/orders/{order_id}/cancel", response_model=schemas.OrderResponse)
+@db_endpoint
 def cancel_order(
     order_id: int,
-    user_identifier: Optional[str] = Query(None, description="Optional: verify ownership by user (id, email, or username)"),
+    user_id: Optional[int] = Depends(identifiers.optional_user_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -273,20 +178,8 @@ def cancel_order(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Verify ownership if user_identifier is provided
-    if user_identifier:
-        user = None
-        if user_identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(user_identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == user_identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == user_identifier).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if order.user_id != user.id:
-            raise HTTPException(status_code=403, detail="Order does not belong to this user")
+    if user_id is not None and order.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Order does not belong to this user")
     
     # Check if order can be cancelled
     non_cancellable_statuses = ["delivered", "cancelled"]
@@ -296,18 +189,38 @@ def cancel_order(
             detail=f"Cannot cancel order with status '{order.status}'. Only orders that are not delivered or already cancelled can be cancelled."
         )
     
-    # Update order status to cancelled
-    order.status = "cancelled"
+    # Only the request that moves the order out of the status read above
+    # cancels it, so concurrent cancellations can't restock twice
+    cancelled = db.execute(
+        update(order_table).where(order_table.c.id == order.id, order_table.c.status == order.status).values(status="cancelled")
+    ).rowcount
+    if not cancelled:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="The order was updated concurrently. Please try again.")
+    
+    # Give the reserved stock back
+    restocked = dict(db.execute(
+        update(product_table)
+        .where(product_table.c.id == order_item_table.c.product_id, order_item_table.c.order_id == order.id)
+        .values(stock=product_table.c.stock + order_item_table.c.quantity)
+        .returning(product_table.c.id, product_table.c.stock)
+    ).all())
+    order_stats.record_status_change(db, order.user_id, order.status, "cancelled", order.total_amount)
+    # Both are written already; update the loaded objects without a flush
+    set_committed_value(order, "status", "cancelled")
+    for item in order.order_items:
+        set_committed_value(item.product, "stock", restocked[item.product_id])
     db.commit()
-    db.refresh(order)
+    invalidate_catalog(stock_only=True)
     
     return order
 
 # Download invoice for an order
 @router.get("/orders/{order_id}/invoice")
+@db_endpoint
 def download_invoice(
     order_id: int,
-    user_identifier: Optional[str] = Query(None, description="Optional: verify ownership by user (id, email, or username)"),
+    user_id: Optional[int] = Depends(identifiers.optional_user_id),
     db: Session = Depends(get_db)
 ):
     """
@@ -325,52 +238,34 @@ def download_invoice(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Verify ownership if user_identifier is provided
-    if user_identifier:
-        user = None
-        if user_identifier.isdigit():
-            user = db.query(models.User).filter(models.User.id == int(user_identifier)).first()
-        else:
-            user = db.query(models.User).filter(models.User.email == user_identifier).first()
-            if not user:
-                user = db.query(models.User).filter(models.User.username == user_identifier).first()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if order.user_id != user.id:
-            raise HTTPException(status_code=403, detail="Order does not belong to this user")
-    
-    # Build invoice data
-    invoice_items = []
-    for item in order.order_items:
-        invoice_items.append({
-            "product_id": item.product_id,
-            "product_name": item.product.name,
-            "quantity": item.quantity,
-            "unit_price": item.price,
-            "subtotal": item.price * item.quantity
-        })
-    
-    invoice_data = {
-        "invoice_number": f"INV-{order.id:06d}",
-        "order_id": order.id,
-        "invoice_date": order.created_at.isoformat(),
-        "order_date": order.created_at.isoformat(),
-        "status": order.status,
-        "customer": {
-            "user_id": order.user.id,
-            "name": order.user.full_name or order.user.username,
-            "email": order.user.email,
-            "username": order.user.username
-        },
-        "shipping_address": order.shipping_address,
-        "items": invoice_items,
-        "subtotal": order.total_amount,
-        "tax": 0.0,  # Can be calculated if tax is implemented
-        "shipping": 0.0,  # Can be calculated if shipping fees are implemented
-        "total": order.total_amount,
-        "currency": "USD"  # Can be made configurable
-    }
-    
-    return invoice_data
+    if user_id is not None and order.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Order does not belong to this user")
+    
+    items = [
+        invoices.InvoiceLine(item.product_id, item.product.name, item.quantity, item.price)
+        for item in order.order_items
+    ]
+    return invoices.build_invoice(order, order.user, items)
 
+# Export invoices in bulk
+@router.get("/orders/invoices/export", dependencies=[Depends(auth.get_admin_user)])
+def export_invoices(
+    request: Request,
+    start_date: Optional[date] = Query(None, description="Only orders placed on or after this date"),
+    end_date: Optional[date] = Query(None, description="Only orders placed on or before this date"),
+    status: Optional[str] = Query(None, description="Only orders with this status"),
+    format: str = Query("jsonl", pattern=streaming.EXPORT_FORMAT_PATTERN, description="jsonl (one invoice per line) or csv (one row per line item)"),
+):
+    """
+    Stream the invoices of all matching orders, ordered by order ID.
+    Each invoice has the same layout as /orders/{order_id}/invoice.
+    Contains every customer's contact details, so it is limited to admins.
+    """
+    start = datetime.combine(start_date, time.min) if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), time.min) if end_date else None
+    invoice_iter = invoices.iter_invoices(start=start, end=end, status=status)
+    if format == "csv":
+        chunks = streaming.csv_lines(invoices.invoice_csv_rows(invoice_iter), invoices.INVOICE_CSV_FIELDS)
+    else:
+        chunks = streaming.jsonl_lines(invoice_iter)
+    return streaming.export_response(chunks, format, "invoices", compress=streaming.accepts_gzip(request))
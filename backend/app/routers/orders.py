@@ -1,72 +1,161 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import and_, delete, func, insert, literal, select, update
 from sqlalchemy.orm import Session, joinedload
-from typing import List
-from app.database import get_db
-from app import models, schemas, auth
+from typing import List, Optional
+from app.database import get_db, db_endpoint
+from app import models, schemas, auth, idempotency, order_history, order_stats, serialization
+from app.cache import invalidate_catalog
 
-router = APIRouter()
+router = APIRouter(**serialization.router_options("orders"))
+
+orders = models.Order.__table__
+order_items = models.OrderItem.__table__
+cart_items = models.CartItem.__table__
+products = models.Product.__table__
+
+def _product_fields(row) -> dict:
+    return {name: getattr(row, name) for name in schemas.ProductResponse.model_fields}
 
 @router.post("/", response_model=schemas.OrderResponse)
+@db_endpoint
 def create_order(
     order: schemas.OrderCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.TokenData = Depends(auth.get_active_token_user),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_KEY_HEADER, max_length=255),
     db: Session = Depends(get_db)
 ):
-    # Get cart items with product relationship
-    cart_items = db.query(models.CartItem).options(
-        joinedload(models.CartItem.product)
-    ).filter(models.CartItem.user_id == current_user.id).all()
+    # A retry of an already placed order gets the original response back
+    if idempotency_key:
+        replay = idempotency.claim(db, current_user.id, idempotency_key, idempotency.fingerprint(order))
+        if replay is not None:
+            return replay
     
-    if not cart_items:
+    # Lock the cart lines and their products up front, in product id order, so
+    # that overlapping checkouts wait for each other instead of deadlocking.
+    # The order is built from exactly these lines: one added concurrently
+    # stays in the cart.
+    cart = db.execute(
+        select(cart_items.c.id, cart_items.c.product_id, cart_items.c.quantity)
+        .join(products, products.c.id == cart_items.c.product_id)
+        .where(cart_items.c.user_id == current_user.id)
+        .order_by(products.c.id)
+        .with_for_update()
+    ).all()
+    if not cart:
         raise HTTPException(status_code=400, detail="Cart is empty")
+    # Rows written before quantities were validated would add stock back and
+    # lower the total
+    invalid = sorted(row.product_id for row in cart if row.quantity < 1)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid quantity for products: {invalid}")
+    cart_product_ids = [row.product_id for row in cart]
+    line_ids = [row.id for row in cart]
     
-    # Calculate total
-    total_amount = sum(item.product.price * item.quantity for item in cart_items)
+    in_cart = and_(
+        cart_items.c.product_id == products.c.id,
+        cart_items.c.id.in_(line_ids)
+    )
     
-    # Create order
-    db_order = models.Order(
-        user_id=current_user.id,
-        total_amount=total_amount,
-        shipping_address=order.shipping_address,
-        status="pending"
+    # Reserve stock for every line at once. Rows stay locked until commit, so
+    # concurrent checkouts can't both take the last unit.
+    reserved = db.execute(
+        update(products)
+        .where(in_cart, products.c.stock >= cart_items.c.quantity)
+        .values(stock=products.c.stock - cart_items.c.quantity)
+        .returning(*products.c)
+    ).all()
+    if len(reserved) < len(cart_product_ids):
+        db.rollback()
+        reserved_ids = {row.id for row in reserved}
+        short = sorted(set(cart_product_ids) - reserved_ids)
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for products: {short}")
+    
+    total_amount = (
+        select(func.sum(products.c.price * cart_items.c.quantity))
+        .where(in_cart)
+        .scalar_subquery()
     )
-    db.add(db_order)
-    db.flush()
+    db_order = db.execute(
+        insert(orders).values(
+            user_id=current_user.id,
+            total_amount=total_amount,
+            shipping_address=order.shipping_address,
+            status="pending"
+        ).returning(*orders.c)
+    ).one()
+    order_stats.record_order(db, current_user.id, db_order.status, db_order.total_amount)
     
-    # Create order items
-    for cart_item in cart_items:
-        order_item = models.OrderItem(
-            order_id=db_order.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            price=cart_item.product.price
-        )
-        db.add(order_item)
+    lines = db.execute(
+        insert(order_items).from_select(
+            ["order_id", "product_id", "quantity", "price"],
+            select(
+                literal(db_order.id),
+                cart_items.c.product_id,
+                cart_items.c.quantity,
+                products.c.price
+            ).where(in_cart)
+        ).returning(*order_items.c)
+    ).all()
     
-    # Clear cart
-    db.query(models.CartItem).filter(models.CartItem.user_id == current_user.id).delete()
+    db.execute(delete(cart_items).where(cart_items.c.id.in_(line_ids)))
     
+    product_by_id = {row.id: _product_fields(row) for row in reserved}
+    response = schemas.OrderResponse(
+        id=db_order.id,
+        user_id=db_order.user_id,
+        total_amount=db_order.total_amount,
+        status=db_order.status,
+        shipping_address=db_order.shipping_address,
+        created_at=db_order.created_at,
+        order_items=[
+            schemas.OrderItemResponse(
+                id=line.id,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                price=line.price,
+                product=product_by_id[line.product_id]
+            )
+            for line in sorted(lines, key=lambda line: line.id)
+        ]
+    )
+    if idempotency_key:
+        idempotency.complete(db, current_user.id, idempotency_key, response)
     db.commit()
-    # Reload with relationships
-    db_order = db.query(models.Order).options(
-        joinedload(models.Order.order_items).joinedload(models.OrderItem.product)
-    ).filter(models.Order.id == db_order.id).first()
-    return db_order
+    invalidate_catalog(stock_only=True)
+    return response
 
-@router.get("/", response_model=List[schemas.OrderResponse])
+@router.get("/", response_model=List[schemas.OrderHistoryResponse])
+@db_endpoint
 def get_orders(
-    current_user: models.User = Depends(auth.get_current_user),
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque X-Next-Cursor value from the previous page"),
+    current_user: schemas.TokenData = Depends(auth.get_token_user),
     db: Session = Depends(get_db)
 ):
-    orders = db.query(models.Order).options(
-        joinedload(models.Order.order_items).joinedload(models.OrderItem.product)
-    ).filter(models.Order.user_id == current_user.id).all()
+    orders, headers = order_history.list_orders(db, current_user.id, limit, cursor)
+    response.headers.update(headers)
     return orders
 
+@router.get("/summary", response_model=List[schemas.OrderSummary])
+@db_endpoint
+def get_order_summaries(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque X-Next-Cursor value from the previous page"),
+    current_user: schemas.TokenData = Depends(auth.get_token_user),
+    db: Session = Depends(get_db)
+):
+    """Order totals and item counts without the line items"""
+    summaries, headers = order_history.list_order_summaries(db, current_user.id, limit, cursor)
+    response.headers.update(headers)
+    return summaries
+
 @router.get("/{order_id}", response_model=schemas.OrderResponse)
+@db_endpoint
 def get_order(
     order_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: schemas.TokenData = Depends(auth.get_token_user),
     db: Session = Depends(get_db)
 ):
     order = db.query(models.Order).options(
@@ -1,50 +1,154 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import codecs
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.database import get_db
-from app import models, schemas
+from app.database import get_db, db_endpoint
+from app import models, schemas, auth, catalog, catalog_import, categories, serialization, streaming, search as product_search
+from app.cache import catalog_cache, invalidate_catalog
+from app.pagination import NEXT_CURSOR_HEADER, apply_keyset, encode_cursor
 
-router = APIRouter()
+router = APIRouter(**serialization.router_options("products"))
+
+# Sort keys accepted by get_products; a leading "-" sorts descending.
+PRODUCT_SORT_COLUMNS = {
+    "id": models.Product.id,
+    "price": models.Product.price,
+    "rating": models.Product.rating,
+    "created_at": models.Product.created_at,
+}
+PRODUCT_SORT_PATTERN = "^-?(" + "|".join(PRODUCT_SORT_COLUMNS) + ")$"
+
+def _iter_product_rows(category: Optional[str]):
+    """Product rows (not ORM objects) by id, read with a server-side cursor"""
+    query = select(*catalog.PRODUCT_COLUMNS)
+    if category:
+        query = query.where(models.Product.category == category)
+    return streaming.stream_batches(query.order_by(models.Product.id))
+
+def _list_products(db: Session, skip, limit, category, search, sort, cursor):
+    if search:
+        # Relevance-ordered full-text search
+        return product_search.search_products(db, search, category=category, skip=skip, limit=limit), {}
+    
+    # Plain rows rather than Product instances: the result is only serialized
+    query = catalog.query_products(db)
+    
+    if category:
+        query = query.filter(models.Product.category == category)
+    
+    # Keyset pagination on (sort column, id); skip is only honoured for the first page
+    descending = sort.startswith("-")
+    column = PRODUCT_SORT_COLUMNS[sort.lstrip("-")]
+    query = apply_keyset(query, sort, column, models.Product.id, cursor, descending=descending)
+    if not cursor and skip:
+        query = query.offset(skip)
+    
+    headers = {}
+    products = query.limit(limit + 1).all()
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, getattr(last, column.key), last.id)
+    return products, headers
 
 @router.get("/", response_model=List[schemas.ProductResponse])
+@db_endpoint
 def get_products(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     category: Optional[str] = None,
     search: Optional[str] = None,
+    sort: str = Query("id", pattern=PRODUCT_SORT_PATTERN, description="id, price, rating or created_at; prefix with '-' for descending"),
+    cursor: Optional[str] = Query(None, description="Opaque X-Next-Cursor value from the previous page"),
     db: Session = Depends(get_db)
 ):
-    query = db.query(models.Product)
-    
-    if category:
-        query = query.filter(models.Product.category == category)
-    
-    if search:
-        query = query.filter(
-            models.Product.name.ilike(f"%{search}%") |
-            models.Product.description.ilike(f"%{search}%")
-        )
-    
-    products = query.offset(skip).limit(limit).all()
-    return products
+    return catalog_cache.respond(
+        request,
+        List[schemas.ProductResponse],
+        lambda: _list_products(db, skip, limit, category, search, sort, cursor),
+    )
 
-@router.get("/{product_id}", response_model=schemas.ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
+# Registered before /{product_id} so that "export" is not captured as an id.
+@router.get("/export")
+def export_products(
+    request: Request,
+    format: str = Query("jsonl", pattern=streaming.EXPORT_FORMAT_PATTERN, description="jsonl or csv"),
+    category: Optional[str] = None,
+):
+    """Stream the whole catalog (or one category), gzip-compressed when the client accepts it"""
+    rows = (row._asdict() for row in _iter_product_rows(category))
+    if format == "csv":
+        chunks = streaming.csv_lines(rows, catalog.PRODUCT_FIELDS)
+    else:
+        chunks = streaming.jsonl_lines(rows)
+    return streaming.export_response(chunks, format, "products", compress=streaming.accepts_gzip(request))
+
+def _get_product(db: Session, product_id: int):
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return product, {}
+
+@router.get("/{product_id}", response_model=schemas.ProductResponse)
+@db_endpoint
+def get_product(request: Request, product_id: int, db: Session = Depends(get_db)):
+    return catalog_cache.respond(request, schemas.ProductResponse, lambda: _get_product(db, product_id))
 
 @router.get("/categories/list", response_model=List[str])
-def get_categories(db: Session = Depends(get_db)):
-    categories = db.query(models.Product.category).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+@db_endpoint
+def get_categories(request: Request, db: Session = Depends(get_db)):
+    return catalog_cache.respond(
+        request, List[str], lambda: (categories.get_category_names(db), {}), ttl=categories.expires_in()
+    )
+
+@router.get("/categories/summary", response_model=List[schemas.CategorySummary])
+@db_endpoint
+def get_category_summary(request: Request, db: Session = Depends(get_db)):
+    """Per-category product count, price range and in-stock count for faceted navigation"""
+    return catalog_cache.respond(
+        request, List[schemas.CategorySummary], lambda: (categories.get_summaries(db), {}),
+        ttl=categories.expires_in(),
+    )
 
 @router.post("/", response_model=schemas.ProductResponse)
+@db_endpoint
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
     db_product = models.Product(**product.dict())
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    invalidate_catalog()
     return db_product
 
+# Not wrapped in db_endpoint: the import reads the upload and writes in
+# batches for a long time, so it always runs in the threadpool on the sync
+# engine rather than inside the event loop.
+@router.post("/import", response_model=schemas.ProductImportResult, dependencies=[Depends(auth.get_admin_user)])
+def import_catalog(
+    file: UploadFile = File(..., description="CSV with a header row, or JSON Lines"),
+    format: Optional[str] = Query(None, pattern=catalog_import.IMPORT_FORMAT_PATTERN, description="csv or jsonl; detected from the file name when omitted"),
+    batch_size: int = Query(catalog_import.IMPORT_BATCH_SIZE, ge=1, le=50000),
+    update_existing: bool = Query(True, description="Update products whose name already exists instead of skipping them"),
+    db: Session = Depends(get_db)
+):
+    """Bulk insert or update products, matched by name"""
+    import_format = format or catalog_import.detect_format(file.filename)
+    if not import_format:
+        raise HTTPException(status_code=400, detail="Could not detect the file format; pass format=csv or format=jsonl")
+    
+    # Decoded line by line: the SpooledTemporaryFile behind the upload can't be
+    # wrapped in a TextIOWrapper before Python 3.11
+    lines = codecs.iterdecode(file.file, "utf-8-sig")
+    try:
+        return catalog_import.import_products(
+            db,
+            catalog_import.parse_records(lines, import_format),
+            batch_size=batch_size,
+            update_existing=update_existing,
+            on_progress=catalog_import.log_progress,
+        )
+    finally:
+        # Batches are committed as they go, so refresh even after a failure
+        invalidate_catalog()
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Dict, List, Optional
+from app import profiling
+
+def require_profiling_token(token: Optional[str] = Header(None, alias=profiling.PROFILING_HEADER)):
+    """Profiles expose code paths and timings, so reading them needs the profiling token"""
+    if not profiling.token_matches(token):
+        raise HTTPException(status_code=403, detail="A valid profiling token is required")
+
+router = APIRouter(dependencies=[Depends(require_profiling_token)])
+
+# List stored profiles
+@router.get("/", response_model=List[Dict])
+def list_profiles():
+    """Metadata of the stored request profiles, newest first"""
+    return profiling.list_profiles()
+
+# Download a profile
+@router.get("/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str):
+    """
+    Collapsed stacks of a profile ("frame;frame;frame samples" per line), ready
+    for flamegraph.pl, speedscope or inferno-flamegraph
+    """
+    profile = profiling.read_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import Optional, List, Literal
 from datetime import datetime
 
 # User schemas
@@ -40,13 +40,32 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductImportError(BaseModel):
+    line: int
+    error: str
+
+class ProductImportResult(BaseModel):
+    processed: int = 0
+    loaded: int = 0
+    failed: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+    errors: List[ProductImportError] = []
+
+class CategorySummary(BaseModel):
+    category: str
+    product_count: int
+    min_price: float
+    max_price: float
+    in_stock_count: int
+
 # Cart schemas
 class CartItemBase(BaseModel):
     product_id: int
     quantity: int = 1
 
 class CartItemCreate(CartItemBase):
-    pass
+    quantity: int = Field(1, ge=1)
 
 class CartItemResponse(CartItemBase):
     id: int
@@ -57,6 +76,21 @@ class CartItemResponse(CartItemBase):
     class Config:
         from_attributes = True
 
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: int
+    # 0 is only meaningful for "set" (same as "remove"); remove ignores it
+    quantity: int = Field(1, ge=0)
+
+    @model_validator(mode="after")
+    def check_add_quantity(self):
+        if self.op == "add" and self.quantity < 1:
+            raise ValueError("add needs a quantity of at least 1")
+        return self
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., max_length=500)
+
 # Order schemas
 class OrderItemBase(BaseModel):
     product_id: int
@@ -87,6 +121,46 @@ class OrderResponse(OrderBase):
     class Config:
         from_attributes = True
 
+# Order history schemas: list views only need a few product columns per line
+class OrderProductSummary(BaseModel):
+    id: int
+    name: str
+    price: float
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class OrderHistoryItem(OrderItemBase):
+    id: int
+    product: OrderProductSummary
+    
+    class Config:
+        from_attributes = True
+
+class OrderHistoryResponse(OrderBase):
+    id: int
+    user_id: int
+    total_amount: float
+    status: str
+    created_at: datetime
+    order_items: List[OrderHistoryItem] = []
+    
+    class Config:
+        from_attributes = True
+
+class OrderSummary(OrderBase):
+    id: int
+    user_id: int
+    total_amount: float
+    status: str
+    created_at: datetime
+    item_count: int
+    
+    class Config:
+        from_attributes = True
+
 # Auth schemas
 class Token(BaseModel):
     access_token: str
@@ -94,4 +168,6 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    id: Optional[int] = None
+    email: Optional[str] = None
 
@@ -0,0 +1,166 @@
+"""
+Product search.
+
+On PostgreSQL products are matched against the GIN-indexed tsvector declared
+on models.Product and ordered by ts_rank_cd. Other dialects (the SQLite setups
+used for local testing) fall back to an in-process inverted index built from
+the products table and rebuilt lazily after catalog writes.
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app import catalog, models
+from app.cache import on_catalog_change
+from app.database import DB_ASYNC
+
+# Field weights of the fallback index, mirroring the A/B/C weights of the
+# PostgreSQL search vector.
+NAME_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def search_products(
+    db: Session,
+    q: str,
+    category: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 20,
+) -> List[Row]:
+    """Return product rows (see app.catalog) matching every term of ``q`` (prefix match), best match first."""
+    terms = tokenize(q)
+    if not terms:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_postgres(db, terms, category, skip, limit)
+    return _search_fallback(db, terms, category, skip, limit)
+
+
+# ---------------------------------------------------------
+# PostgreSQL full-text search
+# ---------------------------------------------------------
+
+def _search_postgres(db, terms, category, skip, limit):
+    Product = models.Product
+    vector = models.product_search_vector(Product.name, Product.description, Product.category)
+    # Terms are plain \w+ tokens, so they are safe to join into tsquery syntax.
+    tsquery = func.to_tsquery(models.SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+
+    query = catalog.query_products(db).filter(vector.op("@@")(tsquery))
+    if category:
+        query = query.filter(Product.category == category)
+
+    return query.order_by(
+        func.ts_rank_cd(vector, tsquery).desc(),
+        Product.id,
+    ).offset(skip).limit(limit).all()
+
+
+# ---------------------------------------------------------
+# In-process fallback index
+# ---------------------------------------------------------
+
+class InvertedIndex:
+    """Immutable term -> {product_id: weight} index with prefix lookups."""
+
+    def __init__(self, rows):
+        postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.categories: Dict[int, Optional[str]] = {}
+        for product_id, name, description, category in rows:
+            self.categories[product_id] = category
+            for text, weight in (
+                (name, NAME_WEIGHT),
+                (category, CATEGORY_WEIGHT),
+                (description, DESCRIPTION_WEIGHT),
+            ):
+                for token in tokenize(text):
+                    scores = postings[token]
+                    scores[product_id] = scores.get(product_id, 0.0) + weight
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+
+    def _prefix_scores(self, prefix: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            for product_id, weight in self.postings[token].items():
+                scores[product_id] = scores.get(product_id, 0.0) + weight
+        return scores
+
+    def search(self, terms: List[str], category: Optional[str] = None) -> List[Tuple[int, float]]:
+        ranked: Optional[Dict[int, float]] = None
+        for term in terms:
+            scores = self._prefix_scores(term)
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {pid: ranked[pid] + score for pid, score in scores.items() if pid in ranked}
+            if not ranked:
+                return []
+        results = ranked.items()
+        if category:
+            results = [(pid, score) for pid, score in results if self.categories.get(pid) == category]
+        return sorted(results, key=lambda item: (-item[1], item[0]))
+
+
+_index: Optional[InvertedIndex] = None
+_index_version = 0
+_index_lock = threading.Lock()
+
+
+@on_catalog_change
+def invalidate():
+    """Drop the fallback index; it is rebuilt on the next search."""
+    global _index, _index_version
+    _index_version += 1
+    _index = None
+
+
+def _get_index(db: Session) -> InvertedIndex:
+    global _index
+    index = _index
+    if index is not None:
+        return index
+    # With DB_ASYNC the build runs in a greenlet on the event loop thread,
+    # where waiting for the lock would block the loop; concurrent searches
+    # then build their own copy instead.
+    if not _index_lock.acquire(blocking=not DB_ASYNC):
+        return _build_index(db)
+    try:
+        if _index is not None:
+            return _index
+        version = _index_version
+        index = _build_index(db)
+        # Only publish the index if no write invalidated it while it was built.
+        if version == _index_version:
+            _index = index
+        return index
+    finally:
+        _index_lock.release()
+
+
+def _build_index(db: Session) -> InvertedIndex:
+    Product = models.Product
+    return InvertedIndex(db.query(Product.id, Product.name, Product.description, Product.category).all())
+
+
+def _search_fallback(db, terms, category, skip, limit):
+    ranked = _get_index(db).search(terms, category)[skip:skip + limit]
+    return catalog.products_by_ids(db, [product_id for product_id, _ in ranked])
@@ -0,0 +1,130 @@
+"""
+Fast response serialization.
+
+By default FastAPI validates an endpoint's return value against its
+response_model, turns the result back into plain Python data
+(jsonable_encoder) and encodes that with the stdlib json module. Routers built
+with ``router_options`` instead use FastSerializationRoute: the return value
+is validated once against a TypeAdapter built when the route is registered
+and dumped straight to JSON bytes by pydantic-core. Instances of the response
+model (e.g. built from RETURNING rows) pass through without re-validation.
+Routes without a response_model answer with ORJSONResponse when orjson is
+installed.
+
+Routers opt in by name through FAST_SERIALIZATION_ROUTERS ("all", "none" or
+a comma-separated list such as "products,orders").
+"""
+import functools
+import inspect
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ORJSONResponse needs orjson at render time
+DEFAULT_RESPONSE_CLASS = ORJSONResponse if orjson is not None else JSONResponse
+
+FAST_SERIALIZATION_ROUTERS = os.getenv("FAST_SERIALIZATION_ROUTERS", "all").lower()
+
+# Name of the parameter added to wrapped endpoints to receive FastAPI's
+# sub-response, whose headers (e.g. X-Next-Cursor) and status code must be
+# carried over to the response built here.
+_SUB_RESPONSE_PARAM = "fast_serialization_response"
+
+
+@functools.lru_cache(maxsize=None)
+def type_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def dump_json(schema, data) -> bytes:
+    """Validate ``data`` (ORM objects, rows or dicts) against ``schema`` and encode it."""
+    adapter = type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def is_enabled(router_name: str) -> bool:
+    if FAST_SERIALIZATION_ROUTERS in ("all", "*"):
+        return True
+    if FAST_SERIALIZATION_ROUTERS in ("", "none"):
+        return False
+    return router_name in {name.strip() for name in FAST_SERIALIZATION_ROUTERS.split(",")}
+
+
+def _build_response(adapter: TypeAdapter, result: Any, sub_response: Response, status_code: Optional[int]) -> Response:
+    if isinstance(result, Response):
+        response = result
+    else:
+        body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+        response = Response(
+            content=body,
+            media_type="application/json",
+            status_code=sub_response.status_code or status_code or 200,
+        )
+    for key, value in sub_response.headers.items():
+        if key not in ("content-length", "content-type"):
+            response.headers.setdefault(key, value)
+    return response
+
+
+def _wrap_endpoint(endpoint, response_model, status_code: Optional[int]):
+    adapter = type_adapter(response_model)
+    signature = inspect.signature(endpoint)
+    parameters = list(signature.parameters.values())
+    # FastAPI injects a single sub-response; reuse the endpoint's own
+    # Response parameter when it declares one.
+    response_param = next(
+        (param.name for param in parameters
+         if inspect.isclass(param.annotation) and issubclass(param.annotation, Response)),
+        None,
+    )
+    owns_param = response_param is None
+    if owns_param:
+        response_param = _SUB_RESPONSE_PARAM
+        parameters.append(inspect.Parameter(response_param, inspect.Parameter.KEYWORD_ONLY, annotation=Response))
+
+    def sub_response(kwargs) -> Response:
+        return kwargs.pop(response_param) if owns_param else kwargs[response_param]
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            response = sub_response(kwargs)
+            return _build_response(adapter, await endpoint(*args, **kwargs), response, status_code)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            response = sub_response(kwargs)
+            return _build_response(adapter, endpoint(*args, **kwargs), response, status_code)
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    wrapper.fast_serialization = True
+    return wrapper
+
+
+class FastSerializationRoute(APIRoute):
+    """APIRoute serializing its response_model with a pre-built TypeAdapter."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        if isinstance(response_model, DefaultPlaceholder):
+            response_model = None
+        if response_model is not None and not getattr(endpoint, "fast_serialization", False):
+            endpoint = _wrap_endpoint(endpoint, response_model, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
+
+
+def router_options(router_name: str) -> Dict[str, Any]:
+    """APIRouter keyword arguments selecting the fast path for ``router_name`` when enabled."""
+    if not is_enabled(router_name):
+        return {}
+    return {"route_class": FastSerializationRoute, "default_response_class": DEFAULT_RESPONSE_CLASS}
@@ -0,0 +1,104 @@
+"""
+Helpers for streaming large result sets as JSON Lines or CSV, gzip-compressed
+on the fly for clients that accept it.
+
+Exports must not hold the whole result in memory, so rows are read with
+``yield_per`` (a server-side cursor on PostgreSQL) and encoded chunk by chunk
+into a StreamingResponse. The generators open their own session: they run
+after the endpoint has returned, outside the request's ``get_db`` session and
+on the sync engine even when DB_ASYNC is enabled (Starlette iterates sync
+generators in its threadpool).
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app import database
+
+STREAM_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "csv": ("text/csv", "csv"),
+}
+EXPORT_FORMAT_PATTERN = "^(" + "|".join(EXPORT_FORMATS) + ")$"
+
+
+def stream_batches(statement, batch_size: int = STREAM_BATCH_SIZE, process: Callable[[Session, list], Iterable] = None) -> Iterator:
+    """
+    Execute ``statement`` in a new session and yield its rows batch by batch.
+    ``process(db, rows)`` may turn each batch into output items, e.g. by
+    loading related rows for the whole batch with one query.
+    """
+    db = database.SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield from (process(db, rows) if process else rows)
+    finally:
+        db.close()
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def jsonl_lines(items: Iterable[Dict[str, Any]], batch_size: int = STREAM_BATCH_SIZE) -> Iterator[str]:
+    buffer: List[str] = []
+    for item in items:
+        buffer.append(json.dumps(item, default=_json_default, separators=(",", ":")) + "\n")
+        if len(buffer) >= batch_size:
+            yield "".join(buffer)
+            buffer.clear()
+    if buffer:
+        yield "".join(buffer)
+
+
+def csv_lines(rows: Iterable[Dict[str, Any]], fieldnames: Sequence[str], batch_size: int = STREAM_BATCH_SIZE) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def accepts_gzip(request: Request) -> bool:
+    encodings = request.headers.get("accept-encoding", "")
+    return any(part.split(";")[0].strip() == "gzip" for part in encodings.split(","))
+
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(chunks: Iterator[str], export_format: str, filename: str, compress: bool = False) -> StreamingResponse:
+    media_type, extension = EXPORT_FORMATS[export_format]
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{extension}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_chunks(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
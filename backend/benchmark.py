@@ -0,0 +1,417 @@
+"""
+Script to benchmark the API with scripted user scenarios.
+
+Seeds a deterministic synthetic dataset (products, users with order history)
+on first use, then runs each scenario with a number of concurrent virtual
+users and reports throughput and latency percentiles per request. Requests go
+to the ASGI app in-process by default, or to a running server with --url.
+
+Scenarios:
+    browse    - category listing, product detail, category list
+    search    - catalog search and chatbot product search
+    cart      - add to cart, view cart
+    checkout  - add two products, place an order (with an Idempotency-Key)
+    chatbot   - order history and order stats lookup by username
+
+Usage:
+    python benchmark.py --database-url sqlite:///benchmark.db
+    python benchmark.py --scenarios browse,search --concurrency 32 --requests 2000
+    python benchmark.py --url http://localhost:8000 --json results.json
+
+Without --database-url the DB_* / DATABASE_URL settings (or .env) are used;
+the dataset is always seeded through the database, also with --url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple
+
+BENCHMARK_PASSWORD = "benchmark-password"
+USER_PREFIX = "bench-user-"
+PRODUCT_PREFIX = "Bench product "
+SEED_BATCH_SIZE = 5000
+
+CATEGORIES = [
+    "Dinnerware", "Kitchenware", "Home Decor", "Garden & Outdoor", "Lighting",
+    "Serveware", "Drinkware", "Planters", "Vases", "Wall Art",
+    "Storage", "Bath", "Festive", "Tea Sets", "Cookware",
+]
+WORDS = [
+    "clay", "terracotta", "stoneware", "glazed", "handmade", "khurja", "blue", "black",
+    "pottery", "vase", "bowl", "planter", "mug", "platter", "lamp", "diya", "kulhad",
+    "tea", "serving", "jar", "matki", "rustic", "modern", "painted", "carved",
+]
+STATUSES = ["delivered"] * 17 + ["shipped"] * 2 + ["cancelled", "processing", "pending"]
+
+
+# ---------------------------------------------------------
+# Synthetic dataset
+# ---------------------------------------------------------
+
+def seed_dataset(args):
+    """Insert the synthetic dataset unless benchmark users already exist."""
+    from sqlalchemy import func, insert, select
+    from app import catalog_import, models, order_stats
+    from app.database import SessionLocal
+    from app.passwords import pwd_context
+
+    db = SessionLocal()
+    try:
+        existing = db.scalar(select(func.count()).where(models.User.username.like(f"{USER_PREFIX}%")))
+        if existing:
+            print(f"♻️  Reusing the existing benchmark dataset ({existing} users)")
+            return
+
+        rng = random.Random(args.random_seed)
+        start = time.perf_counter()
+        print(f"🌱 Seeding {args.products} products, {args.users} users, "
+              f"{args.users * args.orders_per_user} orders...")
+
+        products = []
+        for i in range(args.products):
+            products.append({
+                "name": f"{PRODUCT_PREFIX}{i:06d}",
+                "description": " ".join(rng.choice(WORDS) for _ in range(12)),
+                "price": round(rng.uniform(99, 9999), 2),
+                "image_url": None,
+                "category": rng.choice(CATEGORIES),
+                # Large enough that checkouts never run out of stock
+                "stock": 1_000_000,
+                "rating": round(rng.uniform(3, 5), 1),
+                "review_count": rng.randint(0, 500),
+            })
+            if len(products) == SEED_BATCH_SIZE:
+                catalog_import.load_batch(db, products, update_existing=False)
+                products = []
+        catalog_import.load_batch(db, products, update_existing=False)
+        db.commit()
+
+        catalog = db.execute(
+            select(models.Product.id, models.Product.price).where(models.Product.name.like(f"{PRODUCT_PREFIX}%"))
+        ).all()
+
+        # One bcrypt hash shared by all users keeps seeding fast
+        hashed_password = pwd_context.hash(BENCHMARK_PASSWORD)
+        users = [
+            {
+                "email": f"{USER_PREFIX}{i:06d}@example.com",
+                "username": f"{USER_PREFIX}{i:06d}",
+                "hashed_password": hashed_password,
+                "full_name": f"Benchmark User {i}",
+                "is_active": True,
+            }
+            for i in range(args.users)
+        ]
+        user_ids = []
+        for offset in range(0, len(users), SEED_BATCH_SIZE):
+            user_ids += db.scalars(
+                insert(models.User).returning(models.User.id, sort_by_parameter_order=True),
+                users[offset:offset + SEED_BATCH_SIZE],
+            ).all()
+
+        now = datetime.now(timezone.utc)
+        orders, lines = [], []
+
+        def flush_orders():
+            order_ids = db.scalars(
+                insert(models.Order).returning(models.Order.id, sort_by_parameter_order=True), orders
+            ).all()
+            items = [
+                {"order_id": order_id, "product_id": product_id, "quantity": quantity, "price": price}
+                for order_id, order_lines in zip(order_ids, lines)
+                for product_id, quantity, price in order_lines
+            ]
+            for offset in range(0, len(items), SEED_BATCH_SIZE):
+                db.execute(insert(models.OrderItem), items[offset:offset + SEED_BATCH_SIZE])
+            orders.clear()
+            lines.clear()
+
+        for user_id in user_ids:
+            for _ in range(args.orders_per_user):
+                order_lines = [
+                    (product.id, rng.randint(1, 3), product.price)
+                    for product in rng.sample(catalog, rng.randint(1, 4))
+                ]
+                orders.append({
+                    "user_id": user_id,
+                    "total_amount": round(sum(quantity * price for _, quantity, price in order_lines), 2),
+                    "status": rng.choice(STATUSES),
+                    "shipping_address": "221B Benchmark Street",
+                    "created_at": now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+                })
+                lines.append(order_lines)
+                if len(orders) == SEED_BATCH_SIZE:
+                    flush_orders()
+        if orders:
+            flush_orders()
+
+        if order_stats.ORDER_STATS_MATERIALIZED:
+            order_stats.rebuild(db)
+        db.commit()
+        print(f"✅ Seeded in {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+
+def load_fixtures(args) -> Dict:
+    """Product ids, categories and usernames the scenarios pick from."""
+    from sqlalchemy import select
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        product_ids = db.scalars(
+            select(models.Product.id).where(models.Product.name.like(f"{PRODUCT_PREFIX}%")).order_by(models.Product.id)
+        ).all()
+        usernames = db.scalars(
+            select(models.User.username).where(models.User.username.like(f"{USER_PREFIX}%")).order_by(models.User.id)
+        ).all()
+    finally:
+        db.close()
+    return {"product_ids": product_ids, "usernames": usernames, "categories": CATEGORIES}
+
+
+# ---------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------
+
+class VirtualUser(NamedTuple):
+    username: str
+    headers: Dict[str, str]
+    rng: random.Random
+
+
+async def browse(client, user, fixtures, record):
+    category = user.rng.choice(fixtures["categories"])
+    await record("GET /api/products/?category", client.get("/api/products/", params={"category": category, "limit": 20}))
+    product_id = user.rng.choice(fixtures["product_ids"])
+    await record("GET /api/products/{id}", client.get(f"/api/products/{product_id}"))
+    await record("GET /api/products/categories/list", client.get("/api/products/categories/list"))
+
+
+async def search(client, user, fixtures, record):
+    terms = " ".join(user.rng.sample(WORDS, 2))
+    await record("GET /api/products/?search", client.get("/api/products/", params={"search": terms, "limit": 20}))
+    await record("GET /api/chatbot/products/search", client.get("/api/chatbot/products/search", params={"q": user.rng.choice(WORDS)}))
+
+
+async def cart(client, user, fixtures, record):
+    product_id = user.rng.choice(fixtures["product_ids"])
+    await record("POST /api/cart/", client.post("/api/cart/", json={"product_id": product_id, "quantity": 1}, headers=user.headers))
+    await record("GET /api/cart/", client.get("/api/cart/", headers=user.headers))
+
+
+async def checkout(client, user, fixtures, record):
+    for product_id in user.rng.sample(fixtures["product_ids"], 2):
+        await record("POST /api/cart/", client.post("/api/cart/", json={"product_id": product_id, "quantity": 1}, headers=user.headers))
+    headers = {**user.headers, "Idempotency-Key": str(uuid.UUID(int=user.rng.getrandbits(128)))}
+    await record("POST /api/orders/", client.post("/api/orders/", json={"shipping_address": "221B Benchmark Street"}, headers=headers))
+
+
+async def chatbot(client, user, fixtures, record):
+    username = user.rng.choice(fixtures["usernames"])
+    await record("GET /api/chatbot/orders/user/{identifier}", client.get(f"/api/chatbot/orders/user/{username}"))
+    await record("GET /api/chatbot/orders/stats/{identifier}", client.get(f"/api/chatbot/orders/stats/{username}"))
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "browse": browse,
+    "search": search,
+    "cart": cart,
+    "checkout": checkout,
+    "chatbot": chatbot,
+}
+
+
+# ---------------------------------------------------------
+# Runner
+# ---------------------------------------------------------
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+async def login(client, username: str) -> Dict[str, str]:
+    response = await client.post("/api/auth/login", data={"username": username, "password": BENCHMARK_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_scenario(client, name: str, users: List[VirtualUser], fixtures: Dict, iterations: int, warmup: int) -> Dict:
+    scenario = SCENARIOS[name]
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    measuring = False
+
+    async def record(label, request):
+        start = time.perf_counter()
+        response = await request
+        elapsed = time.perf_counter() - start
+        if measuring:
+            latencies.setdefault(label, []).append(elapsed)
+            if response.status_code >= 400:
+                errors[label] = errors.get(label, 0) + 1
+
+    async def worker(user: VirtualUser, remaining: List[int]):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            await scenario(client, user, fixtures, record)
+
+    await asyncio.gather(*(worker(user, [warmup // len(users) or 1]) for user in users))
+    measuring = True
+    shared = [iterations]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(user, shared) for user in users))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        "iterations": iterations,
+        "elapsed_seconds": round(elapsed, 3),
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "requests": {
+            label: summarize(values, errors.get(label, 0), elapsed)
+            for label, values in sorted(latencies.items())
+        },
+    }
+
+
+def print_report(results: Dict):
+    header = f"{'request':<44} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    for name, result in results["scenarios"].items():
+        print("=" * len(header))
+        print(f"📊 {name}: {result['iterations']} iterations in {result['elapsed_seconds']}s")
+        print(header)
+        rows = list(result["requests"].items()) + [("total", result["total"])]
+        for label, stats in rows:
+            print(
+                f"{label:<44} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+                f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['max_ms']:>8}"
+            )
+    print("=" * len(header))
+
+
+async def run_benchmark(args, fixtures: Dict) -> Dict:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        lifespan = None
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=args.timeout)
+        # ASGITransport does not send lifespan events
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            rng = random.Random(args.random_seed)
+            usernames = fixtures["usernames"][:args.concurrency]
+            headers = await asyncio.gather(*(login(client, username) for username in usernames))
+            users = [
+                VirtualUser(username, user_headers, random.Random(rng.getrandbits(64)))
+                for username, user_headers in zip(usernames, headers)
+            ]
+            results = {}
+            for name in args.scenarios:
+                print(f"🏃 Running {name} ({args.requests} iterations, {len(users)} virtual users)...")
+                results[name] = await run_scenario(client, name, users, fixtures, args.requests, args.warmup)
+            return results
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API with scripted user scenarios.")
+    parser.add_argument("--database-url", help="SQLAlchemy URL to use instead of the DB_* settings, e.g. sqlite:///benchmark.db")
+    parser.add_argument("--url", help="Benchmark a running server (e.g. http://localhost:8000) instead of the app in-process")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--requests", type=int, default=500, help="Measured iterations per scenario (default: 500)")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured iterations before each scenario (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual users (default: 16)")
+    parser.add_argument("--products", type=int, default=10000, help="Synthetic products to seed (default: 10000)")
+    parser.add_argument("--users", type=int, default=1000, help="Synthetic users to seed (default: 1000)")
+    parser.add_argument("--orders-per-user", type=int, default=10, help="Orders per synthetic user (default: 10)")
+    parser.add_argument("--random-seed", type=int, default=42, help="Seed of the dataset and the request mix (default: 42)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds (default: 30)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    if args.concurrency > args.users:
+        parser.error("--concurrency cannot exceed --users (each virtual user logs in as a seeded user)")
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    # Imported after DATABASE_URL is set: app.database creates the engines on import
+    from app import database
+    from app.migrations import upgrade_database
+
+    upgrade_database()
+    seed_dataset(args)
+    fixtures = load_fixtures(args)
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "target": args.url or "in-process",
+            "database": database.engine.dialect.name,
+            "db_async": database.DB_ASYNC,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "products": len(fixtures["product_ids"]),
+            "users": len(fixtures["usernames"]),
+            "orders_per_user": args.orders_per_user,
+            "random_seed": args.random_seed,
+            "python": platform.python_version(),
+        },
+    }
+    results["scenarios"] = asyncio.run(run_benchmark(args, fixtures))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+
+    failed = sum(result["total"]["errors"] for result in results["scenarios"].values())
+    if failed:
+        print(f"⚠️  {failed} requests failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
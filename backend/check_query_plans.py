@@ -0,0 +1,255 @@
+"""
+Script to check the query plans of the API's hot queries on PostgreSQL.
+
+It seeds a realistic amount of synthetic users, products, carts and orders,
+runs the read and checkout paths of each router while recording the SQL they
+issue, and EXPLAINs every statement. It fails (exit code 1) when a plan reads
+a large table with a sequential scan, which usually means a missing index.
+
+Everything runs in one transaction that is rolled back at the end, so the
+script can be pointed at a development database.
+
+Usage:
+    python check_query_plans.py
+    python check_query_plans.py --users 2000 --min-rows 5000 --verbose
+"""
+import argparse
+import inspect
+import itertools
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app import database, identifiers, invoices, order_history, order_stats, schemas, search
+from app.migrations import upgrade_database
+from app.routers import cart, chatbot, orders, products
+
+# Ensure the schema is up to date
+upgrade_database()
+
+CHECKED_TABLES = ("users", "products", "cart_items", "orders", "order_items", "idempotency_keys", "user_order_stats")
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+SEED_SQL = [
+    """
+    INSERT INTO products (name, description, price, category, stock, rating, review_count)
+    SELECT 'Plan check product ' || g, 'Hand thrown stoneware piece number ' || g,
+           round((random() * 5000)::numeric, 2), 'Plan check category ' || (g % 50),
+           (random() * 100)::int, round((random() * 5)::numeric, 1), (random() * 500)::int
+    FROM generate_series(1, :products) AS g
+    """,
+    """
+    INSERT INTO users (email, username, hashed_password, full_name, is_active)
+    SELECT 'plan-check-' || g || '@example.com', 'plan-check-' || g, 'x', 'Plan Check ' || g, true
+    FROM generate_series(1, :users) AS g
+    """,
+    # Most orders are delivered; pending and processing ones are rare
+    """
+    INSERT INTO orders (user_id, total_amount, status, shipping_address, created_at)
+    SELECT u.id, round((random() * 20000)::numeric, 2),
+           CASE WHEN g % 100 < 85 THEN 'delivered' WHEN g % 100 < 92 THEN 'shipped'
+                WHEN g % 100 < 96 THEN 'cancelled' WHEN g % 100 < 98 THEN 'processing'
+                ELSE 'pending' END,
+           'Plan check address', now() - random() * interval '365 days'
+    FROM users u CROSS JOIN generate_series(1, :orders_per_user) AS g
+    WHERE u.username LIKE 'plan-check-%'
+    """,
+    """
+    INSERT INTO order_items (order_id, product_id, quantity, price)
+    SELECT o.id, p.ids[1 + ((o.id * 7 + g) % array_length(p.ids, 1))], 1 + g, 100
+    FROM orders o
+    CROSS JOIN generate_series(1, :items_per_order) AS g
+    CROSS JOIN (SELECT array_agg(id) AS ids FROM products WHERE name LIKE 'Plan check product %') AS p
+    WHERE o.shipping_address = 'Plan check address'
+    """,
+    """
+    INSERT INTO cart_items (user_id, product_id, quantity)
+    SELECT u.id, p.ids[1 + ((u.id * 3 + g) % array_length(p.ids, 1))], 1
+    FROM users u
+    CROSS JOIN generate_series(1, 3) AS g
+    CROSS JOIN (SELECT array_agg(id) AS ids FROM products WHERE name LIKE 'Plan check product %') AS p
+    WHERE u.username LIKE 'plan-check-%'
+    """,
+]
+
+
+class Sample(NamedTuple):
+    user: schemas.TokenData
+    order_id: int
+    product_id: int
+    category: str
+
+
+def _endpoint(func):
+    # Call the plain handler even when db_endpoint wrapped it for DB_ASYNC
+    return inspect.unwrap(func)
+
+
+def _list_two_pages(db, sample, category, sort):
+    _, headers = products._list_products(db, 0, 20, category, None, sort, None)
+    products._list_products(db, 0, 20, category, None, sort, headers.get(products.NEXT_CURSOR_HEADER))
+
+
+def _export_first_invoices(db, sample):
+    end = datetime.now(timezone.utc)
+    stream = invoices.iter_invoices(end - timedelta(days=7), end, None)
+    list(itertools.islice(stream, 10))
+    stream.close()
+
+
+# Hot paths of each router, called the way the endpoints call them
+CHECKS: List[tuple] = [
+    ("products: list by category", lambda db, s: _list_two_pages(db, s, s.category, "id")),
+    ("products: list by price", lambda db, s: _list_two_pages(db, s, None, "-price")),
+    ("products: list newest", lambda db, s: _list_two_pages(db, s, None, "-created_at")),
+    ("products: search", lambda db, s: search.search_products(db, "stoneware 1234")),
+    ("products: detail", lambda db, s: products._get_product(db, s.product_id)),
+    ("cart: items", lambda db, s: _endpoint(cart.get_cart)(current_user=s.user, db=db)),
+    ("orders: history", lambda db, s: order_history.list_orders(db, s.user.id, 20)),
+    ("orders: summaries", lambda db, s: order_history.list_order_summaries(db, s.user.id, 20)),
+    ("orders: detail", lambda db, s: _endpoint(orders.get_order)(order_id=s.order_id, current_user=s.user, db=db)),
+    ("orders: checkout", lambda db, s: _endpoint(orders.create_order)(
+        order=schemas.OrderCreate(shipping_address="Plan check checkout"),
+        current_user=s.user, idempotency_key="plan-check", db=db,
+    )),
+    ("chatbot: resolve identifier", lambda db, s: identifiers.resolve_user_id(db, s.user.email)),
+    ("chatbot: orders by status", lambda db, s: _endpoint(chatbot.get_orders_by_status)(status="pending", user_id=None, db=db)),
+    ("chatbot: user orders by status", lambda db, s: _endpoint(chatbot.get_orders_by_status)(status="delivered", user_id=s.user.id, db=db)),
+    ("chatbot: user cart", lambda db, s: _endpoint(chatbot.get_user_cart)(user_id=s.user.id, db=db)),
+    ("chatbot: order stats", lambda db, s: order_stats.get_order_stats(db, s.user.id)),
+    ("chatbot: invoice export", _export_first_invoices),
+]
+
+
+class StatementRecorder:
+    """Collect the statements sent through ``engine`` while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in EXPLAINABLE:
+            self.statements.append((statement, parameters[0] if executemany else parameters))
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def seq_scans(plan: dict):
+    """Yield the relation names read by Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def seed(connection, args):
+    print("🌱 Seeding synthetic data...")
+    params = {
+        "products": args.products,
+        "users": args.users,
+        "orders_per_user": args.orders_per_user,
+        "items_per_order": args.items_per_order,
+    }
+    for statement in SEED_SQL:
+        connection.execute(text(statement), params)
+    for table in CHECKED_TABLES:
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def load_sample(connection) -> Sample:
+    user = connection.execute(text(
+        "SELECT id, username, email FROM users WHERE username LIKE 'plan-check-%' ORDER BY id LIMIT 1"
+    )).one()
+    order_id = connection.execute(text("SELECT min(id) FROM orders WHERE user_id = :id"), {"id": user.id}).scalar()
+    product = connection.execute(text(
+        "SELECT id, category FROM products WHERE name LIKE 'Plan check product %' ORDER BY id LIMIT 1"
+    )).one()
+    return Sample(
+        user=schemas.TokenData(id=user.id, username=user.username, email=user.email),
+        order_id=order_id,
+        product_id=product.id,
+        category=product.category,
+    )
+
+
+def check_query_plans(args) -> bool:
+    engine = database.engine
+    if engine.dialect.name != "postgresql":
+        print(f"❌ Query plans can only be checked on PostgreSQL (got {engine.dialect.name})")
+        return False
+
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        seed(connection, args)
+        sample = load_sample(connection)
+        large_tables = {
+            name for name, rows in connection.execute(
+                text("SELECT relname, reltuples FROM pg_class WHERE relname = ANY(:tables)"),
+                {"tables": list(CHECKED_TABLES)},
+            )
+            if rows >= args.min_rows
+        }
+        print(f"📊 Tables with at least {args.min_rows} rows: {', '.join(sorted(large_tables))}")
+        print("=" * 60)
+
+        # Commits inside the checked code only release a savepoint
+        db = Session(bind=connection, join_transaction_mode="create_savepoint")
+        failures = 0
+        for name, run in CHECKS:
+            with StatementRecorder(engine) as recorder:
+                run(db, sample)
+            problems = []
+            for statement, parameters in recorder.statements:
+                plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+                scanned = sorted(set(seq_scans(plan[0]["Plan"])) & large_tables)
+                if scanned:
+                    problems.append((statement, scanned))
+                if args.verbose:
+                    print(f"   {' '.join(statement.split())[:160]}")
+            if problems:
+                failures += 1
+                print(f"❌ {name}")
+                for statement, scanned in problems:
+                    print(f"   Seq Scan on {', '.join(scanned)}: {' '.join(statement.split())[:160]}")
+            else:
+                print(f"✅ {name} ({len(recorder.statements)} statements)")
+        db.close()
+
+        print("=" * 60)
+        if failures:
+            print(f"❌ {failures} of {len(CHECKS)} checks read large tables with sequential scans")
+        else:
+            print(f"✨ All {len(CHECKS)} checks use indexes")
+        return failures == 0
+    finally:
+        transaction.rollback()
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when the API's hot queries scan large tables sequentially.")
+    parser.add_argument("--users", type=int, default=10000, help="Synthetic users to seed (default: 10000)")
+    parser.add_argument("--orders-per-user", type=int, default=20, help="Orders per synthetic user (default: 20)")
+    parser.add_argument("--items-per-order", type=int, default=3, help="Items per synthetic order (default: 3)")
+    parser.add_argument("--products", type=int, default=20000, help="Synthetic products to seed (default: 20000)")
+    parser.add_argument("--min-rows", type=int, default=10000, help="Only flag scans of tables with at least this many rows (default: 10000)")
+    parser.add_argument("--verbose", action="store_true", help="Print every checked statement")
+    args = parser.parse_args()
+
+    print("🔍 Checking query plans...")
+    sys.exit(0 if check_query_plans(args) else 1)
+
+
+if __name__ == "__main__":
+    main()
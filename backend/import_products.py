@@ -0,0 +1,70 @@
+"""
+Script to bulk import products from a CSV or JSON Lines supplier feed.
+Products are matched by name: new ones are added, existing ones updated.
+
+Usage:
+    python import_products.py feed.csv
+    python import_products.py feed.jsonl --batch-size 10000 --skip-existing
+"""
+import argparse
+import sys
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.migrations import upgrade_database
+from app import catalog_import
+
+# Ensure the schema is up to date
+upgrade_database()
+
+
+def print_progress(stats):
+    rate = stats.processed / stats.elapsed_seconds if stats.elapsed_seconds else 0.0
+    print(
+        f"   {stats.processed:>9} rows | {stats.loaded:>9} loaded | "
+        f"{stats.failed:>6} failed | {rate:>8.0f} rows/s",
+        flush=True,
+    )
+
+
+def import_file(path: str, import_format: str, batch_size: int, update_existing: bool):
+    """Import the products in ``path``."""
+    db: Session = SessionLocal()
+    
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            stats = catalog_import.import_products(
+                db,
+                catalog_import.parse_records(stream, import_format),
+                batch_size=batch_size,
+                update_existing=update_existing,
+                on_progress=print_progress,
+            )
+        
+        print(f"\n{'='*60}")
+        print(f"✨ Import complete in {stats.elapsed_seconds:.1f}s!")
+        print(f"   Processed: {stats.processed} rows")
+        print(f"   Loaded: {stats.loaded} products")
+        print(f"   Failed: {stats.failed} rows")
+        for error in stats.errors:
+            print(f"   ❌ Line {error.line}: {error.error}")
+        print(f"{'='*60}")
+        return stats
+    
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import products from a CSV or JSON Lines file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=catalog_import.IMPORT_FORMATS, help="detected from the file extension when omitted")
+    parser.add_argument("--batch-size", type=int, default=catalog_import.IMPORT_BATCH_SIZE)
+    parser.add_argument("--skip-existing", action="store_true", help="leave products whose name already exists unchanged")
+    args = parser.parse_args()
+    
+    import_format = args.format or catalog_import.detect_format(args.path)
+    if not import_format:
+        sys.exit("❌ Could not detect the file format; pass --format csv or --format jsonl")
+    
+    print(f"🚀 Importing products from {args.path}...")
+    import_file(args.path, import_format, args.batch_size, not args.skip_existing)
@@ -5,11 +5,12 @@ Run this script to add products to your database.
 import sys
 import os
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine, Base
-from app.models import Product
+from app.database import SessionLocal
+from app.migrations import upgrade_database
+from app import catalog_import
 
-# Ensure tables exist
-Base.metadata.create_all(bind=engine)
+# Ensure the schema is up to date
+upgrade_database()
 
 # Modern Indian Pottery Products for Contemporary Society
 PRODUCTS = [
@@ -221,25 +222,9 @@ def populate_products():
     db: Session = SessionLocal()
     
     try:
-        added_count = 0
-        skipped_count = 0
-        
-        for product_data in PRODUCTS:
-            # Check if product already exists
-            existing_product = db.query(Product).filter(
-                Product.name == product_data["name"]
-            ).first()
-            
-            if existing_product:
-                print(f"⏭️  Skipping '{product_data['name']}' - already exists")
-                skipped_count += 1
-                continue
-            
-            # Create new product
-            product = Product(**product_data)
-            db.add(product)
-            added_count += 1
-            print(f"✅ Added '{product_data['name']}' - ₹{product_data['price']}")
+        # Products that already exist (by name) are left unchanged
+        added_count = catalog_import.load_batch(db, PRODUCTS, update_existing=False)
+        skipped_count = len(PRODUCTS) - added_count
         
         db.commit()
         print(f"\n{'='*60}")
@@ -0,0 +1,32 @@
+"""
+Script to rebuild the materialized per-user order statistics.
+Run it after setting ORDER_STATS_MATERIALIZED=true, or whenever order
+statuses were changed outside the API.
+"""
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.migrations import upgrade_database
+from app import order_stats
+
+# Ensure the schema is up to date
+upgrade_database()
+
+
+def rebuild_order_stats():
+    """Recompute user_order_stats from the orders table."""
+    db: Session = SessionLocal()
+    
+    try:
+        order_stats.rebuild(db)
+        db.commit()
+        print("✅ Order statistics rebuilt")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error rebuilding order statistics: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_order_stats()
@@ -26,34 +26,32 @@ export const useCartStore = defineStore('cart', () => {
     }
   }
 
-  async function addToCart(productId, quantity = 1) {
+  // operations: [{ op: 'add' | 'set' | 'remove', product_id, quantity }]
+  // Applied in one request that returns the updated cart.
+  async function applyOperations(operations) {
     try {
-      await api.post('/cart/', { product_id: productId, quantity })
-      await fetchCart()
+      const response = await api.post('/cart/batch', { operations })
+      items.value = response.data
     } catch (error) {
-      console.error('Error adding to cart:', error)
+      console.error('Error updating cart:', error)
       throw error
     }
   }
 
+  function productIdOf(itemId) {
+    return items.value.find(item => item.id === itemId)?.product_id
+  }
+
+  async function addToCart(productId, quantity = 1) {
+    await applyOperations([{ op: 'add', product_id: productId, quantity }])
+  }
+
   async function updateQuantity(itemId, quantity) {
-    try {
-      await api.put(`/cart/${itemId}?quantity=${quantity}`)
-      await fetchCart()
-    } catch (error) {
-      console.error('Error updating cart:', error)
-      throw error
-    }
+    await applyOperations([{ op: 'set', product_id: productIdOf(itemId), quantity }])
   }
 
   async function removeFromCart(itemId) {
-    try {
-      await api.delete(`/cart/${itemId}`)
-      await fetchCart()
-    } catch (error) {
-      console.error('Error removing from cart:', error)
-      throw error
-    }
+    await applyOperations([{ op: 'remove', product_id: productIdOf(itemId) }])
   }
 
   async function clearCart() {
@@ -75,6 +73,7 @@ export const useCartStore = defineStore('cart', () => {
     addToCart,
     updateQuantity,
     removeFromCart,
+    applyOperations,
     clearCart
   }
 })